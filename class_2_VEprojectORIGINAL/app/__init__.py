@@ -5,6 +5,17 @@ from app.blueprints.customers import customer_bp
 from app.blueprints.mechanics import mechanic_bp
 from app.blueprints.serviceTickets import service_ticket_bp
 from app.blueprints.inventory import inventory_bp
+from app.utils.search import build_search_index_command
+from app.utils.indexes import create_indexes_command
+from app.utils.seed import seed_data_command
+from app.utils.log import init_logging
+from app.utils.caching import require_shared_cache
+from app.utils.workers import configure_gevent
+from app.utils.pool import configure_pool, init_pool_metrics
+from app.utils.replicas import init_replicas
+from app.utils.metrics import init_metrics
+from app.utils.query_budget import init_query_budgets
+from app.utils.profiling import init_profiling
 from config import DevelopmentConfig, TestingConfig
 
 
@@ -19,8 +30,22 @@ def create_app(config_name):
     if not config_class:
         raise ValueError(f"Invalid configuration name: {config_name}")
     app.config.from_object(config_class)
+    # deployment overrides, e.g. FLASK_SQLALCHEMY_DATABASE_URI=... or FLASK_RATELIMIT_ENABLED=false
+    app.config.from_prefixed_env()
 
+    # SimpleCache is per process and refused with more than one worker; point CACHE_TYPE at RedisCache,
+    # MemcachedCache or FileSystemCache for those
+    app.config.setdefault("CACHE_TYPE", "SimpleCache")
+    require_shared_cache(app)
+    # memory:// counts per process; sqlite:////path/limits.db shares the limits between the workers on a host
+    app.config.setdefault("RATELIMIT_STORAGE_URI", "memory://")
+
+    init_logging(app)
+    configure_pool(app)
+    configure_gevent(app)
     db.init_app(app)
+    init_pool_metrics(app)
+    init_replicas(app)
     ma.init_app(app)
     limiter.init_app(app)
     cache.init_app(app)
@@ -30,4 +55,12 @@ def create_app(config_name):
     app.register_blueprint(service_ticket_bp, url_prefix="/service_tickets", name="service_ticket_bp")
     app.register_blueprint(inventory_bp, url_prefix="/inventory", name="inventory_bp")
 
+    app.cli.add_command(build_search_index_command)
+    app.cli.add_command(create_indexes_command)
+    app.cli.add_command(seed_data_command)
+
+    init_metrics(app)
+    init_query_budgets(app)
+    init_profiling(app)
+
     return app
\ No newline at end of file
@@ -1,12 +1,25 @@
 
+import logging
 from flask import jsonify, request
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from marshmallow import ValidationError
 from . import customer_bp
 from app.models import Customers, db
 from app.blueprints.serviceTickets.schemas import ServiceTickets
-from .schemas import customer_schema, login_schema, update_customer_schema
+from .schemas import customer_schema, customers_schema, login_schema, update_customer_schema
 from app.extensions import limiter
+from app.utils.search import fulltext_search
+from app.utils.pagination import keyset_paginate
+from app.utils.bulk import validate_rows, bulk_insert, bulk_response
+from app.utils.caching import cached_view, invalidate_on_write, read_only
+from app.utils.query_budget import query_budget
+from app.utils.projections import customer_projection, service_ticket_projection
+from app.utils.json_aggregation import sql_json_enabled, json_select, json_response
+
+logger = logging.getLogger(__name__)
+
+invalidate_on_write(customer_bp, "customers")
 
 #I seperate these code blocks for better readability and organization for me. 
 #------------------------------------------------------------------------------
@@ -14,39 +27,30 @@ from app.utils import token_required
 
 
 @customer_bp.route("/my-tickets", methods=["GET"])
+@query_budget(2)
 @token_required
 def get_my_tickets(customer_id):
     try:
-        tickets = db.session.query(ServiceTickets).filter_by(customer_id=customer_id).all()
-
-        tickets_list = [
-            {
-                "id": ticket.id,
-                "service_description": ticket.service_description,
-                "cost": ticket.cost,
-                "vin_number": ticket.vin_number,
-                "work_complete": ticket.work_complete,
-                "car_submission_date": ticket.car_submission_date.isoformat(),
-                "work_start_date": ticket.work_start_date.isoformat() if ticket.work_start_date else None,
-                "work_finish_date": ticket.work_finish_date.isoformat() if ticket.work_finish_date else None,
-                "inventory_items": [
-                    {
-                        "id": item.id,
-                        "name": item.name,
-                        "price": item.price,
-                        "quantity": item.quantity
-                    }
-                    for item in ticket.inventory_items
-                ]
-            }
-            for ticket in tickets
-        ]
+        projection = service_ticket_projection.for_request()
+        if sql_json_enabled():
+            query = (json_select(projection)
+                     .where(ServiceTickets.customer_id == int(customer_id))
+                     .order_by(ServiceTickets.id))
+            return json_response(db.session.execute(query).all()), 200
+
+        query = (projection.select()
+                 .where(ServiceTickets.customer_id == int(customer_id))
+                 .order_by(ServiceTickets.id))
+        tickets_list = projection.all(query)
         return jsonify(tickets_list), 200
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception as e:
-        print(f"Error retrieving tickets: {str(e)}")
+        logger.exception("Error retrieving tickets", extra={"customer_id": customer_id})
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
 
 @customer_bp.route("/login", methods=["POST"])
+@read_only
 def login_customer():
     try:
         login_data = login_schema.load(request.json)
@@ -87,7 +91,11 @@ def create_customer():
                              password=customer_data["password"])
 
     db.session.add(new_customer)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "A customer with this email already exists"}), 409
 
     return jsonify({"id": new_customer.id,
                    "name": new_customer.name,
@@ -99,47 +107,64 @@ def create_customer():
                    "email": new_customer.email}), 201
 
 
+@customer_bp.route("/bulk", methods=['POST'])
+@limiter.limit("15 per hour")
+def bulk_create_customers():
+    try:
+        valid, errors = validate_rows(customers_schema, request.json)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    #emails are unique, so reject repeats inside the batch and ones already taken in a single query
+    taken = set(db.session.execute(
+        select(Customers.email).where(Customers.email.in_([row["email"] for row in valid.values()]))).scalars())
+    for index, row in list(valid.items()):
+        if row["email"] in taken:
+            errors[index] = {"email": ["A customer with this email already exists"]}
+            del valid[index]
+        taken.add(row["email"])
+
+    try:
+        created = bulk_insert(Customers, valid)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "A customer with one of these emails already exists"}), 409
+    body, status = bulk_response(created, errors)
+    return jsonify(body), status
+
+
 @customer_bp.route("/", methods=["GET"])
+@query_budget(2)
+@cached_view("customers")
 def get_customers():
     try:
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 3, type=int)
-        
-        pagination = db.session.query(Customers).paginate(page=page, per_page=per_page)
-        
-        customers_list = [{
-            "id": customer.id,
-            "name": customer.name,
-            "phone_number": customer.phone_number,
-            "car_brand": customer.car_brand,
-            "car_type": customer.car_type,
-            "car_mileage": customer.car_mileage,
-            "mechanical_issue": customer.mechanical_issue
-        } for customer in pagination.items]
-
-        return jsonify({
-            "customers": customers_list,
-            "total": pagination.total,
-            "page": pagination.page,
-            "pages": pagination.pages
-        }), 200
+        projection = customer_projection.for_request()
+        page = keyset_paginate(projection.select(), Customers)
+        customers_list = projection.rows_to_dicts(page.items)
+
+        response = {"customers": customers_list, "next_cursor": page.next_cursor}
+        if page.total is not None:
+            response["total"] = page.total
+        return jsonify(response), 200
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception("Error listing customers")
         return jsonify({"message": "Try again!"}), 500
 
 
 @customer_bp.route("/search", methods=['GET'])
+@query_budget(1)
+@cached_view("customers")
 def search_customer():
     name = request.args.get("name", "")
-    query = select(Customers).where(Customers.name.like(f"%{name}%"))
-    customers = db.session.execute(query).scalars().all()
-    customers_list = [{"id": customer.id, 
-                       "name": customer.name,
-                       "phone_number": customer.phone_number,
-                       "car_brand": customer.car_brand,
-                       "car_type": customer.car_type,
-                       "car_mileage": customer.car_mileage,
-                       "mechanical_issue": customer.mechanical_issue} for customer in customers]
+    try:
+        projection = customer_projection.for_request()
+        query = fulltext_search(projection.select(), Customers, name)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    customers_list = projection.all(query)
     return jsonify(customers_list), 200
 
 
@@ -158,14 +183,18 @@ def update_customer(id):
         customer.name = update_data.get("name", customer.name)
         customer.email = update_data.get("email", customer.email)
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"message": "A customer with this email already exists"}), 409
 
         return jsonify({
             "id": customer.id,
             "name": customer.name,
             "email": customer.email}), 200
     except Exception as e:
-        print(f"Error updating customer: {str(e)}")
+        logger.exception("Error updating customer", extra={"customer_id": id})
         return jsonify({"message": "Error occurred while updating customer"}), 500
 
 
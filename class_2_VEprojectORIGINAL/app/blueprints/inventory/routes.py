@@ -1,10 +1,18 @@
 from flask import jsonify, request
-from sqlalchemy import select
 from marshmallow import ValidationError
 from . import inventory_bp
 from app.models import Inventory
 from app.models import db
 from .schemas import inventory_schema, inventory_all_schema
+from app.utils.search import fulltext_search
+from app.utils.pagination import keyset_paginate, page_headers
+from app.utils.bulk import validate_rows, bulk_insert, bulk_response
+from app.utils.streaming import wants_stream, stream_rows
+from app.utils.projections import inventory_projection, inventory_search_projection
+from app.utils.caching import cached_view, invalidate_on_write
+from app.utils.query_budget import query_budget
+
+invalidate_on_write(inventory_bp, "inventory", "service_ticket_inventory")
 
 @inventory_bp.route("/", methods=["POST"])
 def create_inventory():
@@ -24,21 +32,46 @@ def create_inventory():
     except ValidationError as e:
         return jsonify(e.messages), 400
 
+@inventory_bp.route("/bulk", methods=["POST"])
+def bulk_create_inventory():
+    try:
+        valid, errors = validate_rows(inventory_all_schema, request.json)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    created = bulk_insert(Inventory, valid, defaults={"quantity": 0})
+    db.session.commit()
+    body, status = bulk_response(created, errors)
+    return jsonify(body), status
+
 @inventory_bp.route("/", methods=['GET'])
+@query_budget(2)
+@cached_view("inventory")
 def get_inventory():
     try:
-        inventory_items = db.session.query(Inventory).all()
-        inventory_list = [{"id": item.id, "name": item.name, "price": item.price, "quantity": item.quantity} for item in inventory_items]
-        return jsonify(inventory_list), 200
+        projection = inventory_projection.for_request()
+        if wants_stream():
+            return stream_rows(projection, projection.select().order_by(Inventory.id))
+
+        page = keyset_paginate(projection.select(), Inventory)
+        inventory_list = projection.rows_to_dicts(page.items)
+        return jsonify(inventory_list), 200, page_headers(page)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception:
         return jsonify({"message": "Error"}), 500
     
 @inventory_bp.route("/search", methods=['GET'])
+@query_budget(1)
+@cached_view("inventory")
 def search_inventory():
     name = request.args.get("name", "")
-    query = select(Inventory).where(Inventory.name.like(f"%{name}%"))
-    inventory_items = db.session.execute(query).scalars().all()
-    inventory_list = [{"id": item.id, "name": item.name, "price": item.price} for item in inventory_items]
+    try:
+        projection = inventory_search_projection.for_request()
+        query = fulltext_search(projection.select(), Inventory, name)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    inventory_list = projection.all(query)
     return jsonify(inventory_list), 200
 
 @inventory_bp.route("/<int:id>", methods=["PUT"])
@@ -1,14 +1,24 @@
+import logging
 from flask import jsonify, request
-from sqlalchemy import select
 from marshmallow import ValidationError
 from . import mechanic_bp
 from app.models import Mechanic
 from app.models import db
 from .schemas import mechanic_schema, mechanics_schema
+from app.utils.search import fulltext_search
+from app.utils.pagination import keyset_paginate, page_headers
+from app.utils.bulk import validate_rows, bulk_insert, bulk_response
+from app.utils.streaming import wants_stream, stream_rows
+from app.utils.projections import mechanic_projection
+from app.utils.caching import cached_view, invalidate_on_write
+from app.utils.query_budget import query_budget
+
+logger = logging.getLogger(__name__)
+
+invalidate_on_write(mechanic_bp, "mechanic")
 
 @mechanic_bp.route("/", methods=['POST'])
 def create_mechanic():
-    print("Incoming request JSON:", request.json)
     try:
         mechanic_data = mechanic_schema.load(request.json)
     except ValidationError as e:
@@ -24,37 +34,50 @@ def create_mechanic():
 
     db.session.add(new_mechanic)
     db.session.commit()
-    print("Mechanic created successfully:", new_mechanic.id)
+    logger.debug("Mechanic created", extra={"mechanic_id": new_mechanic.id})
 
     return jsonify({"id": new_mechanic.id, "message": "Mechanic added successfully"}), 201
 
+@mechanic_bp.route("/bulk", methods=['POST'])
+def bulk_create_mechanics():
+    try:
+        valid, errors = validate_rows(mechanics_schema, request.json)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    created = bulk_insert(Mechanic, valid)
+    db.session.commit()
+    body, status = bulk_response(created, errors)
+    return jsonify(body), status
+
 @mechanic_bp.route("/", methods=['GET'])
+@query_budget(2)
+@cached_view("mechanic")
 def get_mechanics():
     try:
-        mechanics = db.session.query(Mechanic).all()
-        mechanics_list = [{
-                "id": mechanic.id,
-                "mechanic_name": mechanic.mechanic_name,
-                "email": mechanic.email,
-                "address": mechanic.address,
-                "phone_number": mechanic.phone_number,
-                "salary": mechanic.salary} for mechanic in mechanics]
-        return jsonify(mechanics_list), 200
+        projection = mechanic_projection.for_request()
+        if wants_stream():
+            return stream_rows(projection, projection.select().order_by(Mechanic.id))
+
+        page = keyset_paginate(projection.select(), Mechanic)
+        mechanics_list = projection.rows_to_dicts(page.items)
+        return jsonify(mechanics_list), 200, page_headers(page)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception:
         return jsonify({"message": "Error"}), 500
 
 @mechanic_bp.route("/search", methods=['GET'])
+@query_budget(1)
+@cached_view("mechanic")
 def search_mechanic():
     mechanic_name = request.args.get("mechanic_name", "")
-    query = select(Mechanic).where(Mechanic.mechanic_name.like(f"%{mechanic_name}%"))
-    mechanics = db.session.execute(query).scalars().all()
-    mechanics_list = [{
-            "id": mechanic.id,
-            "mechanic_name": mechanic.mechanic_name,
-            "email": mechanic.email,
-            "address": mechanic.address,
-            "phone_number": mechanic.phone_number,
-            "salary": mechanic.salary} for mechanic in mechanics]
+    try:
+        projection = mechanic_projection.for_request()
+        query = fulltext_search(projection.select(), Mechanic, mechanic_name)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    mechanics_list = projection.all(query)
     return jsonify(mechanics_list), 200
 
 @mechanic_bp.route("/<int:id>", methods=['PUT'])
@@ -1,9 +1,21 @@
+import logging
 from flask import jsonify, request
-from sqlalchemy import select
+from sqlalchemy import select, update, insert
 from marshmallow import ValidationError
 from . import service_ticket_bp
-from app.models import ServiceTickets, Inventory, db
-from .schemas import service_ticket_schema, service_tickets_schema
+from app.models import ServiceTickets, Inventory, service_ticket_inventory, db
+from .schemas import service_ticket_schema, service_tickets_schema, add_parts_schema
+from app.utils.pagination import keyset_paginate, page_headers
+from app.utils.search import get_search_limit
+from app.utils.streaming import wants_stream, stream_rows
+from app.utils.projections import service_ticket_projection
+from app.utils.caching import cached_view, invalidate_on_write
+from app.utils.query_budget import query_budget
+from app.utils.json_aggregation import sql_json_enabled, json_select, json_response
+
+logger = logging.getLogger(__name__)
+
+invalidate_on_write(service_ticket_bp, "service_tickets", "service_ticket_inventory", "inventory")
 
 @service_ticket_bp.route("/", methods=['POST'])
 def create_service_ticket():
@@ -15,7 +27,7 @@ def create_service_ticket():
     new_ticket = ServiceTickets(
         service_description=ticket_data["service_description"],
         cost=ticket_data["cost"],
-        vin_number=ticket_data["vin_number"],
+        vin_number=ticket_data["vin_number"].upper(),
         work_complete=ticket_data["work_complete"],
         car_submission_date=ticket_data["car_submission_date"],
         work_start_date=ticket_data.get("work_start_date"),
@@ -31,92 +43,133 @@ def create_service_ticket():
 
 
 @service_ticket_bp.route("/", methods=['GET'])
+@query_budget(3)
+@cached_view("service_tickets", "service_ticket_inventory", "inventory")
 def get_service_tickets():
     try:
-        tickets = db.session.query(ServiceTickets).all()
-        tickets_list = [{
-            "id": ticket.id,
-            "service_description": ticket.service_description,
-            "cost": ticket.cost,
-            "vin_number": ticket.vin_number,
-            "work_complete": ticket.work_complete,
-            "car_submission_date": ticket.car_submission_date.isoformat(),
-            "work_start_date": ticket.work_start_date.isoformat() if ticket.work_start_date else None,
-            "work_finish_date": ticket.work_finish_date.isoformat() if ticket.work_finish_date else None,
-            "inventory_items": [{"id": item.id, "name": item.name, "price": item.price, "quantity": item.quantity}
-                                for item in ticket.inventory_items]
-        } for ticket in tickets]
-
-        return jsonify(tickets_list), 200
+        projection = service_ticket_projection.for_request()
+        query = projection.select()
+        if wants_stream():
+            return stream_rows(projection, query.order_by(ServiceTickets.id))
+
+        if sql_json_enabled():
+            page = keyset_paginate(json_select(projection), ServiceTickets)
+            return json_response(page.items), 200, page_headers(page)
+
+        page = keyset_paginate(query, ServiceTickets)
+        tickets_list = projection.rows_to_dicts(page.items)
+
+        return jsonify(tickets_list), 200, page_headers(page)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception:
         return jsonify({"message": "Error"}), 500
 
 
 @service_ticket_bp.route("/<int:id>/add_part", methods=['POST'])
 def add_part_to_service_ticket(id):
+    # accepts {"part_id": 1, "quantity": 2} or {"parts": [{"part_id": 1, "quantity": 2}, ...]}
+    payload = request.json if isinstance(request.json, dict) else {}
     try:
-        service_ticket = db.session.query(ServiceTickets).filter_by(id=id).first()
-        if not service_ticket:
-            return jsonify({"error": "Service ticket not found"}), 404
-        
-        part_id = request.json.get("part_id")
-        inventory_item = db.session.query(Inventory).filter_by(id=part_id).first()
-        if not inventory_item:
-            return jsonify({"error": "Inventory item not found"}), 404
+        parts_data = add_parts_schema.load(payload if "parts" in payload else {"parts": [payload]})
+    except ValidationError as e:
+        return jsonify(e.messages), 400
 
-        if inventory_item.quantity <= 0:
-            return jsonify({"error": "Not enough stock"}), 400
+    quantities = {}
+    for part in parts_data["parts"]:
+        quantities[part["part_id"]] = quantities.get(part["part_id"], 0) + part["quantity"]
 
-        service_ticket.inventory_items.append(inventory_item)
-        inventory_item.quantity -= 1 
+    try:
+        if db.session.execute(select(ServiceTickets.id).where(ServiceTickets.id == id)).first() is None:
+            return jsonify({"error": "Service ticket not found"}), 404
+
+        # rows are locked in part_id order, so two requests for the same parts in opposite order can't deadlock
+        for part_id, quantity in sorted(quantities.items()):
+            # check and decrement in one statement so concurrent requests can't oversell
+            result = db.session.execute(
+                update(Inventory)
+                .where(Inventory.id == part_id, Inventory.quantity >= quantity)
+                .values(quantity=Inventory.quantity - quantity))
+            if result.rowcount == 0:
+                db.session.rollback()
+                if db.session.execute(select(Inventory.id).where(Inventory.id == part_id)).first() is None:
+                    return jsonify({"error": f"Inventory item {part_id} not found"}), 404
+                return jsonify({"error": f"Not enough stock for inventory item {part_id}"}), 400
+
+        linked = set(db.session.execute(
+            select(service_ticket_inventory.c.inventory_id)
+            .where(service_ticket_inventory.c.service_ticket_id == id,
+                   service_ticket_inventory.c.inventory_id.in_(quantities))).scalars())
+        new_links = [{"service_ticket_id": id, "inventory_id": part_id} for part_id in quantities if part_id not in linked]
+        if new_links:
+            db.session.execute(insert(service_ticket_inventory), new_links)
         db.session.commit()
 
-        return jsonify({"message": f"Part '{inventory_item.name}' added to Service Ticket ID {id}"}), 200
+        return jsonify({"message": f"{len(quantities)} part(s) added to Service Ticket ID {id}",
+                        "parts": [{"part_id": part_id, "quantity": quantity} for part_id, quantity in quantities.items()]}), 200
     except Exception as e:
-        print(f"Error adding part: {str(e)}")  #  for debug(had issues with this)
+        db.session.rollback()
+        logger.exception("Error adding parts to service ticket", extra={"service_ticket_id": id})
         return jsonify({"error": "An error occurred"}), 500
 
 
+VIN_LENGTH = 17
+
+
+def vin_search(query, vin_number, match):
+    limit = get_search_limit()
+    vin = ServiceTickets.vin_number
+    if match == "contains":
+        # only when asked for: a leading wildcard can't use the index
+        return query.where(vin.like(f"%{vin_number}%")).order_by(ServiceTickets.id).limit(limit)
+    if match not in ("auto", "exact", "prefix"):
+        raise ValueError("match must be one of auto, exact, prefix, contains")
+    if not vin_number:
+        return query.order_by(ServiceTickets.id).limit(limit)
+
+    if match == "exact" or (match == "auto" and len(vin_number) == VIN_LENGTH):
+        query = query.where(vin == vin_number)
+    else:
+        # a range on the indexed column is the portable sargable form of LIKE 'prefix%'
+        upper_bound = vin_number[:-1] + chr(ord(vin_number[-1]) + 1)
+        query = query.where(vin >= vin_number, vin < upper_bound)
+    return query.order_by(ServiceTickets.id).limit(limit)
+
+
 @service_ticket_bp.route("/search", methods=['GET'])
+@query_budget(2)
+@cached_view("service_tickets", "service_ticket_inventory", "inventory")
 def search_service_ticket():
-    vin_number = request.args.get("vin_number", "")
-    query = select(ServiceTickets).where(ServiceTickets.vin_number.like(f"%{vin_number}%"))
-    tickets = db.session.execute(query).scalars().all()
-    tickets_list = [{
-        "id": ticket.id,
-        "service_description": ticket.service_description,
-        "cost": ticket.cost,
-        "vin_number": ticket.vin_number,
-        "work_complete": ticket.work_complete,
-        "car_submission_date": ticket.car_submission_date.isoformat(),
-        "work_start_date": ticket.work_start_date.isoformat() if ticket.work_start_date else None,
-        "work_finish_date": ticket.work_finish_date.isoformat() if ticket.work_finish_date else None,
-        "inventory_items": [{"id": item.id, "name": item.name, "price": item.price, "quantity": item.quantity}
-                            for item in ticket.inventory_items]
-    } for ticket in tickets]
+    vin_number = request.args.get("vin_number", "").strip().upper()
+    match = request.args.get("match", "auto")
+    use_sql_json = sql_json_enabled()
+    try:
+        projection = service_ticket_projection.for_request()
+        query = vin_search(json_select(projection) if use_sql_json else projection.select(), vin_number, match)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if use_sql_json:
+        return json_response(db.session.execute(query).all()), 200
+    tickets_list = projection.all(query)
     return jsonify(tickets_list), 200
 
 
 @service_ticket_bp.route("/<int:id>", methods=['PUT'])
 def update_service_ticket(id):
-    print("Incoming ID:", id)
-    print("Incoming JSON:", request.json)
     try:
         ticket = db.session.query(ServiceTickets).filter_by(id=id).first()
         if not ticket:
-            print("Ticket not found!")  # Debug
             return jsonify({"message": "Service ticket not found! Try again!"}), 404
 
         try:
             updated_data = service_ticket_schema.load(request.json)
-            print("Validated Data:", updated_data)  # for debugging
         except ValidationError as e:
-            print("Validation Error:", e.messages)  # for debugging
+            logger.debug("Service ticket update rejected", extra={"service_ticket_id": id, "errors": e.messages})
             return jsonify(e.messages), 400
 
         ticket.service_description = updated_data["service_description"]
         ticket.cost = updated_data["cost"]
-        ticket.vin_number = updated_data["vin_number"]
+        ticket.vin_number = updated_data["vin_number"].upper()
         ticket.work_complete = updated_data["work_complete"]
         ticket.car_submission_date = updated_data["car_submission_date"]
         ticket.work_start_date = updated_data.get("work_start_date")
@@ -125,11 +178,11 @@ def update_service_ticket(id):
         ticket.mechanic_id = updated_data["mechanic_id"]
 
         db.session.commit()
-        print("Ticket Updated Successfully!")  # same 4 debugging
+        logger.debug("Service ticket updated", extra={"service_ticket_id": id})
 
         return jsonify({"message": "Service ticket updated successfully!!!"}), 200
     except Exception as e:
-        print("Exception Occurred:", str(e))  # same 4 debugging
+        logger.exception("Error updating service ticket", extra={"service_ticket_id": id})
         return jsonify({"message": "Error"}), 500
 
 
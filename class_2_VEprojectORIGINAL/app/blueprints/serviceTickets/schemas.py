@@ -1,4 +1,5 @@
 from app.models import ServiceTickets
+from marshmallow import validate
 from app.extensions import ma
 from app.blueprints.inventory.schemas import InventorySchema
 
@@ -11,4 +12,13 @@ class ServiceTicketSchema(ma.SQLAlchemyAutoSchema):
     mechanic_id = ma.Int(required=True)
 
 service_ticket_schema = ServiceTicketSchema()
-service_tickets_schema = ServiceTicketSchema(many=True)
\ No newline at end of file
+service_tickets_schema = ServiceTicketSchema(many=True)
+
+class PartRequestSchema(ma.Schema):
+    part_id = ma.Int(required=True)
+    quantity = ma.Int(load_default=1, validate=validate.Range(min=1))
+
+class AddPartsSchema(ma.Schema):
+    parts = ma.List(ma.Nested(PartRequestSchema), required=True, validate=validate.Length(min=1))
+
+add_parts_schema = AddPartsSchema()
\ No newline at end of file
@@ -2,6 +2,7 @@ from flask_marshmallow import Marshmallow
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_caching import Cache
+import app.utils.rate_limit_storage  # registers the sqlite:// scheme with limits
 
 ma = Marshmallow()
 
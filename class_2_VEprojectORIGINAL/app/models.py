@@ -1,19 +1,38 @@
-from sqlalchemy import Table, Column, ForeignKey
+from flask import current_app
+from sqlalchemy import Table, Column, ForeignKey, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.sql.dml import UpdateBase
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from datetime import date
 from typing import List, Optional
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+class RoutingSession(Session):
+    # read-only requests (app/utils/replicas.py) read from one replica for the whole request; a flush or
+    # an INSERT/UPDATE/DELETE pins the rest of the session to the primary
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get("read_only"):
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info["read_only"] = False
+            else:
+                if "replica" not in self.info:
+                    self.info["replica"] = current_app.extensions["replica_router"].choose()
+                if self.info["replica"] is not None:
+                    return self.info["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 service_ticket_inventory = Table(
     "service_ticket_inventory",
     Base.metadata,
     Column("service_ticket_id", ForeignKey("service_tickets.id"), primary_key=True),
-    Column("inventory_id", ForeignKey("inventory.id"), primary_key=True))
+    Column("inventory_id", ForeignKey("inventory.id"), primary_key=True),
+    #the primary key covers ticket -> parts, this covers part -> tickets
+    Index("ix_service_ticket_inventory_inventory_id", "inventory_id", "service_ticket_id"))
 
 class Customers(Base):
     __tablename__ = "customers"
@@ -25,7 +44,7 @@ class Customers(Base):
     car_type: Mapped[str] = mapped_column(db.String(30), nullable=False)
     car_mileage: Mapped[int] = mapped_column(nullable=False)
     mechanical_issue: Mapped[str] = mapped_column(db.String(250), nullable=False)
-    email: Mapped[str] = mapped_column(db.String(45), nullable=False)
+    email: Mapped[str] = mapped_column(db.String(45), nullable=False, unique=True, index=True)
     password: Mapped[str] = mapped_column(db.String(15), nullable=False)
 
     #one to many
@@ -50,14 +69,14 @@ class ServiceTickets(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     service_description: Mapped[str] = mapped_column(db.String(250), nullable=False)
     cost: Mapped[float] = mapped_column(nullable=False)
-    vin_number: Mapped[str] = mapped_column(db.String(17), nullable=False)
+    vin_number: Mapped[str] = mapped_column(db.String(17), nullable=False, index=True)
     work_complete: Mapped[bool] = mapped_column(nullable=False, default=False)
     car_submission_date: Mapped[date] = mapped_column(nullable=False)
     work_start_date: Mapped[Optional[date]] = mapped_column()
     work_finish_date: Mapped[Optional[date]] = mapped_column()
 
-    customer_id: Mapped[int] = mapped_column(ForeignKey("customers.id"), nullable=False)
-    mechanic_id: Mapped[int] = mapped_column(ForeignKey("mechanic.id"), nullable=False)
+    customer_id: Mapped[int] = mapped_column(ForeignKey("customers.id"), nullable=False, index=True)
+    mechanic_id: Mapped[int] = mapped_column(ForeignKey("mechanic.id"), nullable=False, index=True)
 
     customer: Mapped["Customers"] = relationship("Customers", back_populates="service_tickets")
     mechanic: Mapped["Mechanic"] = relationship("Mechanic", back_populates="service_tickets")
@@ -1,11 +1,71 @@
 import jwt
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 import os
 
 SECRET_KEY = os.environ.get('SECRET_KEY') or 'blueSecrets'
 TOKEN_EXPIRATION_HOURS = int(os.environ.get('TOKEN_EXPIRATION_HOURS', 1))
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 300
+
+
+def jwt_secret():
+    # JWT_SECRET_KEY can be rotated in app.config; the module default keeps the old behaviour
+    return current_app.config.get("JWT_SECRET_KEY", SECRET_KEY)
+
+
+class TokenCache:
+    # verified token -> claims, LRU-bounded. An entry lives for at most TOKEN_CACHE_TTL seconds and
+    # never past the token's own exp, and the whole cache is dropped when the secret changes
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._secret = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token, secret):
+        with self._lock:
+            if secret != self._secret:
+                self._entries.clear()
+                self._secret = secret
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token, secret, claims, size, ttl):
+        expires = time.time() + ttl
+        if "exp" in claims:
+            expires = min(expires, claims["exp"])
+        with self._lock:
+            if secret != self._secret:
+                return
+            self._entries[token] = (expires, claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
+
 
 def encode_token(customer_id):
     payload = {
@@ -13,13 +73,19 @@ def encode_token(customer_id):
         'iat': datetime.now(timezone.utc),
         'sub': str(customer_id)
     }
-    token = jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+    token = jwt.encode(payload, jwt_secret(), algorithm='HS256')
     return token
 
 def decode_token(token):
+    secret = jwt_secret()
+    size = current_app.config.get("TOKEN_CACHE_SIZE", TOKEN_CACHE_SIZE)
+    if size:
+        payload = token_cache.get(token, secret)
+        if payload is not None:
+            return payload
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload
+        payload = jwt.decode(token, secret, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         raise ValueError("Token has expired")
     except jwt.InvalidSignatureError:
@@ -29,30 +95,30 @@ def decode_token(token):
     except jwt.InvalidTokenError:
         raise ValueError("Invalid token")
 
+    if size:
+        token_cache.put(token, secret, payload, size, current_app.config.get("TOKEN_CACHE_TTL", TOKEN_CACHE_TTL))
+    return payload
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
         if 'Authorization' not in request.headers or not request.headers['Authorization'].startswith('Bearer '):
-            print("Authorization header is missing or improperly formatted")  # Debug
             return jsonify({'error': 'Invalid Authorization header format!'}), 400
         
-        token = request.headers['Authorization'].split()[1]
+        token = request.headers['Authorization'].split()[1:]
 
         if not token:
-            print("Token is missing")  # Debug
             return jsonify({'error': 'Token is missing'}), 403
 
         try:
-            data = decode_token(token)
+            data = decode_token(token[0])
             customer_id = data['sub']
-            print(f"Token decoded successfully: {data}")  # Log full payload
-        except jwt.ExpiredSignatureError:
-            print("Token expired")  # Debug
-            return jsonify({'error': 'Token has expired'}), 403
-        except jwt.InvalidTokenError as e:
-            print(f"Token validation failed: {str(e)}")  # Debug
+        except ValueError as e:
+            # decode_token turns every jwt error into a ValueError with the reason
+            return jsonify({'error': str(e)}), 403
+        except KeyError:
             return jsonify({'error': 'Invalid token'}), 403
 
         return f(customer_id, *args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
@@ -0,0 +1,63 @@
+from flask import current_app
+from marshmallow import ValidationError
+from sqlalchemy import insert
+from app.models import db
+
+MAX_ROWS = 1000
+
+
+def validate_rows(schema, rows):
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("Expected a non-empty JSON array")
+    max_rows = current_app.config.get("BULK_MAX_ROWS", MAX_ROWS)
+    if len(rows) > max_rows:
+        raise ValueError(f"At most {max_rows} rows can be created per request")
+
+    # one validation pass over the whole array; marshmallow keys the errors by row index
+    try:
+        data, errors = schema.load(rows, many=True), {}
+    except ValidationError as e:
+        data, errors = e.valid_data, e.messages
+
+    valid = {}
+    for index, row in enumerate(data):
+        if index not in errors:
+            row.pop("id", None)
+            valid[index] = row
+    return valid, errors
+
+
+def bulk_insert(model, valid, defaults=None):
+    indexes = list(valid)
+    rows = [{**(defaults or {}), **valid[index]} for index in indexes]
+    if not rows:
+        return []
+
+    dialect = db.session.get_bind().dialect
+    if dialect.insert_executemany_returning:
+        # one multi-row INSERT ... RETURNING per batch (insertmanyvalues). SQLite has no sentinel to
+        # sort on and would fall back to one INSERT per row, but it assigns the ids of a multi-row
+        # INSERT in VALUES order, so sorting them lines them up with the rows just as well.
+        in_order = dialect.name != "sqlite"
+        statement = insert(model).returning(model.id, sort_by_parameter_order=in_order)
+        ids = db.session.execute(statement, rows).scalars().all()
+        if not in_order:
+            ids.sort()
+    else:
+        # e.g. MySQL has no RETURNING; the unit of work inserts and reads back lastrowid
+        objects = [model(**row) for row in rows]
+        db.session.add_all(objects)
+        db.session.flush()
+        ids = [obj.id for obj in objects]
+
+    return [{"index": index, "id": id} for index, id in zip(indexes, ids)]
+
+
+def bulk_response(created, errors):
+    if not created:
+        status = 400
+    elif errors:
+        status = 207
+    else:
+        status = 201
+    return {"created": created, "errors": {str(index): messages for index, messages in errors.items()}}, status
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+from uuid import uuid4
+from flask import request, current_app
+from app.extensions import cache
+from app.utils.replicas import use_primary_after_write
+from app.utils.streaming import wants_stream
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# caches that live in one process; with more than one gunicorn worker a write in one worker
+# wouldn't bump the table versions the others read
+PER_PROCESS_CACHES = ("SimpleCache", "simple", "flask_caching.backends.SimpleCache",
+                      "flask_caching.backends.simplecache.SimpleCache")
+
+# exported by /metrics (app/utils/metrics.py)
+cache_results = {"hit": 0, "miss": 0, "not_modified": 0}
+_cache_results_lock = threading.Lock()
+
+
+def count_result(result):
+    # += on a dict entry isn't atomic across the threads (or greenlets) of a worker
+    with _cache_results_lock:
+        cache_results[result] += 1
+
+
+def cache_result_counts():
+    with _cache_results_lock:
+        return dict(cache_results)
+
+
+def require_shared_cache(app, workers=None):
+    # gunicorn.conf.py exports the worker count as GUNICORN_WORKERS
+    workers = workers or int(os.environ.get("GUNICORN_WORKERS", 1))
+    if workers > 1 and app.config["CACHE_TYPE"] in PER_PROCESS_CACHES:
+        raise RuntimeError(f"CACHE_TYPE={app.config['CACHE_TYPE']} is per process and can't be invalidated across "
+                           f"{workers} workers; use RedisCache, MemcachedCache or FileSystemCache")
+
+
+def new_version():
+    # "<milliseconds>.<random>": the time gives Last-Modified, the random part keeps two writes in
+    # the same millisecond (or a version that was evicted and recreated) from ever sharing a value
+    return f"{int(time.time() * 1000)}.{uuid4().hex[:12]}"
+
+
+def table_versions(tables):
+    keys = [f"version:{table}" for table in tables]
+    versions = cache.get_many(*keys)
+    missing = {key: new_version() for key, version in zip(keys, versions) if version is None}
+    if missing:
+        cache.set_many(missing, timeout=0)
+    return [version or missing[key] for key, version in zip(keys, versions)]
+
+
+def bump_versions(tables):
+    cache.set_many({f"version:{table}": new_version() for table in tables}, timeout=0)
+
+
+def newest_write(versions):
+    return max(int(version.split(".")[0]) for version in versions)
+
+
+def last_modified(versions):
+    # Last-Modified only has whole seconds. Send the end of the second of the newest write, and only
+    # once that second is over: every later write then has a version at or after it. None while the
+    # second is still running; the ETag covers that response
+    seconds = newest_write(versions) // 1000 + 1
+    if time.time() < seconds:
+        return None
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def is_not_modified(etag, versions):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since is None:
+        return False
+    # a write in the second the header names is newer than the header, not "not modified"
+    return newest_write(versions) < request.if_modified_since.timestamp() * 1000
+
+
+def cached_view(*tables):
+    # the key is the path, the sorted query args and the versions of the tables the view reads, so
+    # any write to one of those tables makes the old entry unreachable and changes the ETag. A
+    # matching If-None-Match is answered with 304 before the view or the cache body is touched.
+    # Shortly after a write to those tables the view reads from the primary, not from a replica that
+    # may not have the write yet.
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if wants_stream():
+                return f(*args, **kwargs)
+
+            versions = table_versions(tables)
+            use_primary_after_write(newest_write(versions) / 1000)
+            query_args = urlencode(sorted(request.args.items(multi=True)))
+            key = f"view:{request.path}?{query_args}:{':'.join(versions)}"
+            etag = hashlib.sha1(key.encode()).hexdigest()
+
+            if is_not_modified(etag, versions):
+                count_result("not_modified")
+                response = current_app.response_class(status=304)
+            else:
+                cached = cache.get(key)
+                if cached is not None:
+                    count_result("hit")
+                    body, status, headers = cached
+                    response = current_app.response_class(body, status=status, headers=headers)
+                else:
+                    count_result("miss")
+                    response = current_app.make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    cache.set(key, (response.get_data(), response.status_code, dict(response.headers)))
+
+            # set on every response rather than cached, Last-Modified shows up once its second is over
+            response.set_etag(etag)
+            modified = last_modified(versions)
+            if modified is not None:
+                response.last_modified = modified
+            return response
+        return decorated
+    return decorator
+
+
+def read_only(f):
+    # for a POST view that writes nothing (login), so invalidate_on_write leaves the versions alone
+    f.read_only = True
+    return f
+
+
+def invalidate_on_write(blueprint, *tables):
+    @blueprint.after_request
+    def bump_written_tables(response):
+        view = current_app.view_functions.get(request.endpoint)
+        if (request.method in WRITE_METHODS and response.status_code < 400
+                and not getattr(view, "read_only", False)):
+            bump_versions(tables)
+        return response
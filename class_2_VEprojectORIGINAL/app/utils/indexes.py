@@ -0,0 +1,100 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, inspect, select, update
+from sqlalchemy.schema import CreateIndex
+from app.models import db, Base, ServiceTickets
+from app.utils.caching import bump_versions
+
+
+def missing_indexes(connection):
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+DUPLICATE_REPORT_LIMIT = 20
+
+
+class DuplicateKeys(Exception):
+    # a unique index can't be built while the table has rows that would violate it
+    def __init__(self, duplicates):
+        super().__init__(", ".join(duplicates))
+        self.duplicates = duplicates
+
+
+def duplicate_keys(connection, index):
+    columns = list(index.columns)
+    query = (select(*columns, func.count()).group_by(*columns).having(func.count() > 1)
+             .order_by(func.count().desc()).limit(DUPLICATE_REPORT_LIMIT))
+    return [(tuple(row[:-1]), row[-1]) for row in connection.execute(query)]
+
+
+def online_index_ddl(index, dialect):
+    columns = ", ".join(column.name for column in index.columns)
+    unique = "UNIQUE " if index.unique else ""
+    if dialect.name == "postgresql":
+        # CONCURRENTLY builds without blocking writes, but can't run inside a transaction
+        return f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {index.table.name} ({columns})"
+    if dialect.name == "mysql":
+        return (f"ALTER TABLE {index.table.name} ADD {unique}INDEX {index.name} ({columns}), "
+                f"ALGORITHM=INPLACE, LOCK=NONE")
+    return str(CreateIndex(index).compile(dialect=dialect))
+
+
+def create_missing_indexes(dry_run=False):
+    created = []
+    with db.engine.connect() as connection:
+        autocommit = connection.execution_options(isolation_level="AUTOCOMMIT")
+        missing = missing_indexes(autocommit)
+        # checked for every index before building any, so a run never stops halfway
+        duplicates = {index.name: groups for index in missing if index.unique
+                      for groups in [duplicate_keys(autocommit, index)] if groups}
+        if duplicates:
+            raise DuplicateKeys(duplicates)
+        for index in missing:
+            statement = online_index_ddl(index, connection.dialect)
+            if not dry_run:
+                autocommit.exec_driver_sql(statement)
+            created.append(statement)
+    return created
+
+
+def uppercase_vins(dry_run=False):
+    # VINs are upper-cased on the way in and looked up upper-cased (exact and prefix), so rows written
+    # before that have to be normalised once or they never match
+    lowercase = ServiceTickets.vin_number != func.upper(ServiceTickets.vin_number)
+    if dry_run:
+        return db.session.execute(select(func.count()).where(lowercase)).scalar()
+    count = db.session.execute(update(ServiceTickets).where(lowercase)
+                               .values(vin_number=func.upper(ServiceTickets.vin_number))).rowcount
+    db.session.commit()
+    if count:
+        bump_versions(["service_tickets"])
+    return count
+
+
+@click.command("create-indexes")
+@click.option("--dry-run", is_flag=True, help="Print the statements without running them.")
+@with_appcontext
+def create_indexes_command(dry_run):
+    vins = uppercase_vins(dry_run)
+    if vins:
+        click.echo(f"{'Would upper-case' if dry_run else 'Upper-cased'} {vins} VINs in service_tickets.")
+    try:
+        statements = create_missing_indexes(dry_run)
+    except DuplicateKeys as e:
+        for name, groups in e.duplicates.items():
+            click.echo(f"{name}: duplicate keys, first {DUPLICATE_REPORT_LIMIT} shown")
+            for values, count in groups:
+                click.echo(f"  {', '.join(map(str, values))}: {count} rows")
+        raise click.ClickException("Fix the duplicate rows, then run create-indexes again; no index was built.")
+    for statement in statements:
+        click.echo(statement)
+    if not statements:
+        click.echo("All indexes are already in place.")
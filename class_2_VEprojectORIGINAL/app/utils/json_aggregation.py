@@ -0,0 +1,69 @@
+from flask import current_app
+from sqlalchemy import Boolean, Text, case, cast, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from app.models import db
+
+SUPPORTED_DIALECTS = ("postgresql", "mysql", "sqlite")
+
+
+def sql_json_enabled():
+    # opt-in per dialect, e.g. SQL_JSON_AGGREGATION = ["postgresql", "mysql"]; otherwise the
+    # Core projection path builds the documents in Python
+    dialect = db.session.get_bind().dialect.name
+    return dialect in SUPPORTED_DIALECTS and dialect in current_app.config.get("SQL_JSON_AGGREGATION", ())
+
+
+def json_value(column, dialect):
+    if isinstance(column.type, Boolean):
+        # SQLite and MySQL store booleans as integers, which would come out as 0/1
+        if dialect == "sqlite":
+            return func.json(case((column, "true"), else_="false"))
+        if dialect == "mysql":
+            return case((column, literal_column("CAST(TRUE AS JSON)")), else_=literal_column("CAST(FALSE AS JSON)"))
+    return column
+
+
+def json_object(pairs, dialect):
+    build = func.json_build_object if dialect == "postgresql" else func.json_object
+    args = []
+    for field, column in pairs:
+        # field names are inlined: PostgreSQL can't infer a type for bound keys in json_build_object
+        args += [literal_column(f"'{field}'"), json_value(column, dialect)]
+    return build(*args)
+
+
+def json_array(nested, parent_id, dialect):
+    child = nested.projection
+    child_id = child.table.c.id
+    rows = (select(*child.columns)
+            .join(nested.parent_key.table, child_id == nested.child_key)
+            .where(nested.parent_key == parent_id)
+            .correlate(parent_id.table))
+
+    if dialect == "postgresql":
+        document = json_object(zip(child.fields, child.columns), dialect)
+        aggregated = rows.with_only_columns(func.json_agg(aggregate_order_by(document, child_id)))
+        return func.coalesce(aggregated.scalar_subquery(), literal_column("'[]'::json"))
+
+    # SQLite and MySQL have no ORDER BY inside the aggregate, so it reads from an ordered derived table
+    ordered = rows.order_by(child_id).subquery()
+    document = json_object(((field, ordered.c[field]) for field in child.fields), dialect)
+    if dialect == "sqlite":
+        return func.json(select(func.json_group_array(document)).scalar_subquery())
+    return func.coalesce(select(func.json_arrayagg(document)).scalar_subquery(), func.json_array())
+
+
+def json_select(projection):
+    # one row per parent: the primary key (for keyset pagination) and the finished JSON document
+    dialect = db.session.get_bind().dialect.name
+    pairs = list(zip(projection.fields, projection.columns))
+    if projection.nested:
+        pairs.append((projection.nested.name, json_array(projection.nested, projection.table.c.id, dialect)))
+    document = cast(json_object(pairs, dialect), Text).label("document")
+    return select(projection.table.c.id, document)
+
+
+def json_response(rows):
+    # the documents are already JSON text, so they're joined rather than parsed and re-encoded
+    body = "[" + ",".join(row.document for row in rows) + "]"
+    return current_app.response_class(body, mimetype="application/json")
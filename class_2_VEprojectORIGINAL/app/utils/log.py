@@ -0,0 +1,147 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from uuid import uuid4
+from flask import current_app, g, request, has_app_context, has_request_context
+from flask.logging import default_handler
+
+QUEUE_SIZE = 10000
+DEFAULT_SAMPLE_RATES = {"DEBUG": 1.0, "INFO": 1.0, "WARNING": 1.0, "ERROR": 1.0, "CRITICAL": 1.0}
+
+# attributes every LogRecord has; anything else came in through extra= and goes into the JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    # runs in the request thread, where g is still available
+    def filter(self, record):
+        record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # keeps a fraction of the records of each level, e.g. {"DEBUG": 0.01, "INFO": 0.1}
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {logging.getLevelName(level): rate for level, rate in rates.items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # never blocks the request thread: when the listener falls behind, records are dropped and counted
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # only the cheap parts happen here; JSON encoding and the write happen on the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AppFilter(logging.Filter):
+    # app.logger is the "app" logger, shared by every app in the process (tests build several). Each
+    # app's handler takes the records logged under its own app context and the newest app's the rest
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def filter(self, record):
+        if has_app_context():
+            return current_app._get_current_object() is self.app
+        handlers = [handler for handler in self.app.logger.handlers if isinstance(handler, DroppingQueueHandler)]
+        return handlers[-1] is self.app.extensions["log_handler"]
+
+
+def stop_logging(app):
+    listener = app.extensions["log_listener"]
+    app.logger.removeHandler(app.extensions["log_handler"])
+    atexit.unregister(listener.stop)
+    listener.stop()
+
+
+def start_logging(app):
+    # app.logger is the "app" logger, so logging.getLogger(__name__) anywhere in the package ends up here
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(app.config.get("LOG_QUEUE_SIZE", QUEUE_SIZE)))
+    handler.addFilter(AppFilter(app))
+    handler.addFilter(SamplingFilter({**DEFAULT_SAMPLE_RATES, **app.config.get("LOG_SAMPLE_RATES", {})}))
+    handler.addFilter(RequestIdFilter())
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(handler)
+    app.logger.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+    app.logger.propagate = False
+
+    app.extensions["log_handler"] = handler
+    app.extensions["log_listener"] = listener
+    # drains what is still queued when the process exits; holds the listener only, not the app
+    atexit.register(listener.stop)
+    return handler
+
+
+def init_logging(app):
+    handler = start_logging(app)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get("X-Request-ID") or uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        # an earlier before_request (the rate limiter) can answer before assign_request_id runs
+        if "request_id" not in g:
+            assign_request_id()
+        response.headers["X-Request-ID"] = g.request_id
+        if app.config.get("LOG_REQUESTS", True):
+            app.logger.info("request", extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - g.request_started) * 1000, 2)})
+        return response
+
+    return handler
+
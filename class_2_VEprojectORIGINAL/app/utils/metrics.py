@@ -0,0 +1,197 @@
+import hmac
+import os
+import threading
+import time
+from flask import abort, g, request, has_request_context
+from sqlalchemy import event
+from app.extensions import limiter
+from app.models import db
+from app.utils import token_cache
+from app.utils.caching import cache_result_counts
+from app.utils.pool import TimedQueuePool
+from app.utils.query_budget import TRANSACTION_CONTROL
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "unmatched"
+LOOPBACK = ("127.0.0.1", "::1")
+POOL_METRICS = (
+    ("db_pool_size", "size", "gauge", "Primary pool size."),
+    ("db_pool_checked_out", "checked_out", "gauge", "Connections in use."),
+    ("db_pool_overflow", "overflow", "gauge", "Connections open beyond pool_size."),
+    ("db_pool_checkouts_total", "checkouts", "counter", "Connection checkouts."),
+    ("db_pool_checkout_timeouts_total", "checkout_timeouts", "counter", "Checkouts that hit pool_timeout."),
+    ("db_pool_checkout_wait_seconds_total", "checkout_wait_seconds_total", "counter", "Time spent waiting for a connection."),
+    ("db_pool_checkout_wait_seconds_max", "checkout_wait_seconds_max", "gauge", "Longest wait for a connection."),
+)
+
+
+class EndpointMetrics:
+    # one per endpoint, created when the app starts; labels are rendered once here so recording a
+    # request only bumps numbers
+    def __init__(self, endpoint):
+        self.label = f'endpoint="{endpoint}"'
+        self.bucket_labels = [f'{self.label},le="{bound}"' for bound in BUCKETS] + [f'{self.label},le="+Inf"']
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.statuses = {}
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.db_statements = 0
+        self.db_seconds = 0.0
+
+    def record(self, status, seconds, db_statements, db_seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.buckets[index] += 1
+            self.count += 1
+            self.seconds += seconds
+            self.db_statements += db_statements
+            self.db_seconds += db_seconds
+
+
+class Metrics:
+    def __init__(self, endpoints):
+        self.endpoints = {endpoint: EndpointMetrics(endpoint) for endpoint in sorted(endpoints) + [UNMATCHED]}
+
+    def reset(self):
+        for metrics in self.endpoints.values():
+            metrics.reset()
+
+    def for_request(self):
+        return self.endpoints.get(request.endpoint) or self.endpoints[UNMATCHED]
+
+    def render(self, replica_router=None):
+        # every gunicorn worker counts on its own; a scrape sees the worker that answered it
+        lines = [f"# counters of worker process {os.getpid()}"]
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        endpoints = self.endpoints.values()
+        family("http_requests_total", "counter", "Requests by endpoint and status code.")
+        for metrics in endpoints:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'http_requests_total{{{metrics.label},status="{status}"}} {count}')
+
+        family("http_request_duration_seconds", "histogram", "Request latency by endpoint.")
+        for metrics in endpoints:
+            if not metrics.count:
+                continue
+            cumulative = 0
+            for label, count in zip(metrics.bucket_labels, metrics.buckets):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{{{label}}} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{{{metrics.label}}} {metrics.seconds}")
+            lines.append(f"http_request_duration_seconds_count{{{metrics.label}}} {metrics.count}")
+
+        family("db_statements_total", "counter", "SQL statements executed by endpoint.")
+        for metrics in endpoints:
+            if metrics.count:
+                lines.append(f"db_statements_total{{{metrics.label}}} {metrics.db_statements}")
+        family("db_time_seconds_total", "counter", "Time spent executing SQL by endpoint.")
+        for metrics in endpoints:
+            if metrics.count:
+                lines.append(f"db_time_seconds_total{{{metrics.label}}} {metrics.db_seconds}")
+
+        family("view_cache_requests_total", "counter", "Cached view lookups by result (hit, miss, not_modified).")
+        for result, count in cache_result_counts().items():
+            lines.append(f'view_cache_requests_total{{result="{result}"}} {count}')
+        tokens = token_cache.stats()
+        family("token_cache_requests_total", "counter", "Verified-JWT cache lookups by result.")
+        lines.append(f'token_cache_requests_total{{result="hit"}} {tokens["hits"]}')
+        lines.append(f'token_cache_requests_total{{result="miss"}} {tokens["misses"]}')
+
+        if isinstance(db.engine.pool, TimedQueuePool):
+            pool = db.engine.pool.stats()
+            for name, key, kind, help_text in POOL_METRICS:
+                family(name, kind, help_text)
+                lines.append(f"{name} {pool[key]}")
+
+        if replica_router is not None:
+            family("db_replica_up", "gauge", "1 when the replica passed its last health check.")
+            for key, healthy in replica_router.status().items():
+                lines.append(f'db_replica_up{{replica="{key}"}} {int(healthy)}')
+
+        return "\n".join(lines) + "\n"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "metrics_started" in g and not statement.startswith(TRANSACTION_CONTROL):
+        conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_query_started")
+    if started and has_request_context() and "metrics_started" in g and not statement.startswith(TRANSACTION_CONTROL):
+        g.db_seconds += time.perf_counter() - started.pop()
+        g.db_statements += 1
+
+
+def allowed(token):
+    if token:
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+    return request.remote_addr in LOOPBACK
+
+
+def init_metrics(app):
+    # call after the blueprints are registered so every endpoint is known up front.
+    # The numbers are per worker process, not per server: scrape each worker (or run one worker
+    # per container) and sum them in Prometheus. /metrics wants "Authorization: Bearer <METRICS_TOKEN>",
+    # or comes from the same host when METRICS_TOKEN isn't set
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    token = app.config.get("METRICS_TOKEN")
+
+    metrics = Metrics([rule.endpoint for rule in app.url_map.iter_rules()] + ["metrics"])
+    app.extensions["metrics"] = metrics
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    replica_router = app.extensions.get("replica_router")
+    if replica_router is not None:
+        engines += [replica.engine for replica in replica_router.replicas]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_recorded = False
+        g.db_statements = 0
+        g.db_seconds = 0.0
+
+    def record(status):
+        if "metrics_started" in g and not g.get("metrics_recorded"):
+            g.metrics_recorded = True
+            metrics.for_request().record(status, time.perf_counter() - g.metrics_started, g.db_statements, g.db_seconds)
+
+    # first in line, so the time spent in the other before_request hooks (rate limiting) counts too
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+
+    @app.after_request
+    def record_response(response):
+        record(response.status_code)
+        return response
+
+    @app.teardown_request
+    def record_error(error):
+        # after_request doesn't run when a view raises
+        if error is not None:
+            record(500)
+
+    @limiter.exempt
+    def serve_metrics():
+        if not allowed(token):
+            abort(404)
+        return app.response_class(metrics.render(replica_router), content_type=CONTENT_TYPE)
+
+    app.add_url_rule("/metrics", "metrics", serve_metrics)
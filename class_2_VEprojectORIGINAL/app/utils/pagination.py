@@ -0,0 +1,83 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from flask import request, current_app
+from sqlalchemy import select, func
+from app.models import db
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+Page = namedtuple("Page", ["items", "next_cursor", "total"])
+
+
+def encode_cursor(last_id):
+    raw = json.dumps({"id": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(raw_limit, default_limit, max_limit):
+    # one limit contract across the API: missing is the default, anything but a positive integer is a
+    # ValueError (the views answer 400), and it is capped at max_limit
+    if raw_limit is None:
+        return default_limit
+    try:
+        limit = int(raw_limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, max_limit)
+
+
+def get_page_args():
+    default_limit = current_app.config.get("PAGINATION_DEFAULT_LIMIT", DEFAULT_LIMIT)
+    max_limit = current_app.config.get("PAGINATION_MAX_LIMIT", MAX_LIMIT)
+
+    # per_page is still accepted as limit for older clients of GET /customers/, but page can't be honoured
+    # with keyset pagination; ignoring it would hand back page 1 forever
+    if "page" in request.args:
+        raise ValueError("page is no longer supported; pass the next_cursor of the previous response as cursor")
+    limit = parse_limit(request.args.get("limit", request.args.get("per_page")), default_limit, max_limit)
+
+    cursor = request.args.get("cursor")
+    after_id = decode_cursor(cursor) if cursor else None
+    with_total = request.args.get("include_total", "").lower() in ("1", "true", "yes")
+    return after_id, limit, with_total
+
+
+def keyset_paginate(query, model):
+    # seeks on the primary key instead of OFFSET so page N costs the same as page 1
+    after_id, limit, with_total = get_page_args()
+
+    total = None
+    if with_total:
+        total = db.session.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    rows = db.session.execute(query.order_by(model.id).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return Page(rows, next_cursor, total)
+
+
+def page_headers(page):
+    headers = {}
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        headers["X-Total-Count"] = str(page.total)
+    return headers
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from app.models import db
+
+logger = logging.getLogger(__name__)
+
+# config key -> create_engine() argument. Set them per environment in the config classes, e.g.
+#   class ProductionConfig:
+#       DB_POOL_SIZE = 20
+#       DB_MAX_OVERFLOW = 10
+#       DB_POOL_RECYCLE = 280   # below MySQL's wait_timeout
+POOL_SETTINGS = {
+    "DB_POOL_SIZE": "pool_size",
+    "DB_MAX_OVERFLOW": "max_overflow",
+    "DB_POOL_TIMEOUT": "pool_timeout",
+    "DB_POOL_PRE_PING": "pool_pre_ping",
+    "DB_POOL_RECYCLE": "pool_recycle",
+    "DB_POOL_USE_LIFO": "pool_use_lifo",
+}
+POOL_DEFAULTS = {
+    # a cheap ping on checkout instead of a failed request after the server dropped an idle connection
+    "DB_POOL_PRE_PING": True,
+    "DB_POOL_RECYCLE": 1800,
+}
+SLOW_CHECKOUT_MS = 100
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long checkouts wait, how often they time out and how far into
+    # overflow the pool goes
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slow_checkout_ms = SLOW_CHECKOUT_MS
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_peak = 0
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.slow_checkout_ms = self.slow_checkout_ms
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+                self.overflow_peak = max(self.overflow_peak, self.overflow())
+            if waited * 1000 >= self.slow_checkout_ms:
+                logger.warning("Slow connection pool checkout", extra={
+                    "wait_ms": round(waited * 1000, 2), "checked_out": self.checkedout(), "pool_size": self.size()})
+
+    def stats(self):
+        with self._metrics_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "overflow_peak": max(self.overflow_peak, 0),
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.timeouts,
+                "checkout_wait_seconds_total": self.wait_seconds_total,
+                "checkout_wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+def configure_pool(app):
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # Flask-SQLAlchemy puts in-memory SQLite on a StaticPool, which takes none of these
+        return
+
+    options.setdefault("poolclass", TimedQueuePool)
+    for key, option in POOL_SETTINGS.items():
+        value = app.config.get(key, POOL_DEFAULTS.get(key))
+        if value is not None:
+            options.setdefault(option, value)
+
+
+def init_pool_metrics(app):
+    slow_checkout_ms = app.config.get("DB_POOL_SLOW_CHECKOUT_MS", SLOW_CHECKOUT_MS)
+    with app.app_context():
+        for engine in db.engines.values():
+            if isinstance(engine.pool, TimedQueuePool):
+                engine.pool.slow_checkout_ms = slow_checkout_ms
+
+
+def pool_stats():
+    pool = db.engine.pool
+    return pool.stats() if isinstance(pool, TimedQueuePool) else None
@@ -0,0 +1,208 @@
+import cProfile
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from uuid import uuid4
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from app.models import db
+from app.utils.query_budget import TRANSACTION_CONTROL
+from app.utils.workers import gevent_active
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Profile"
+MAX_PROFILES = 50
+MAX_BYTES = 100 * 1024 * 1024
+SAMPLE_INTERVAL = 0.001
+EXTENSIONS = (".prof", ".collapsed", ".json")
+
+# one profile at a time per process: cProfile can't run twice at once (Python 3.12+ raises
+# "Another profiling tool is already active"), so a request that finds it held goes unprofiled
+_profiling = threading.Lock()
+
+
+class StackSampler(threading.Thread):
+    # samples the request's Python stack every interval seconds into collapsed-stack counts
+    # ("root;caller;callee count" lines), the input flamegraph.pl and speedscope read
+    def __init__(self, current_frame, interval):
+        super().__init__(daemon=True)
+        self.current_frame = current_frame
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = self.current_frame()
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def requested(secret):
+    return hmac.compare_digest(request.headers.get(HEADER, "").encode(), secret.encode())
+
+
+def request_frame():
+    # returns a function giving the request's current frame, for the sampler
+    if gevent_active():
+        # threading.get_ident() is the greenlet's id there and sys._current_frames() only knows OS
+        # threads. The sampler is a greenlet as well, so it sees the request where it last yielded
+        import greenlet
+        request_greenlet = greenlet.getcurrent()
+        return lambda: request_greenlet.gr_frame
+    thread_id = threading.get_ident()
+    return lambda: sys._current_frames().get(thread_id)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "profile_sql" in g and not statement.startswith(TRANSACTION_CONTROL):
+        conn.info.setdefault("profile_query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("profile_query_started")
+    if started and has_request_context() and "profile_sql" in g and not statement.startswith(TRANSACTION_CONTROL):
+        seconds = time.perf_counter() - started.pop()
+        count, total = g.profile_sql.get(statement, (0, 0.0))
+        g.profile_sql[statement] = (count + 1, total + seconds)
+
+
+def prune(directory, max_profiles, max_bytes):
+    # newest first; a profile is its .prof, .collapsed and .json files
+    profiles = {}
+    for entry in os.scandir(directory):
+        stem, extension = os.path.splitext(entry.name)
+        if extension in EXTENSIONS:
+            stat = entry.stat()
+            mtime, size = profiles.get(stem, (0, 0))
+            profiles[stem] = (max(mtime, stat.st_mtime), size + stat.st_size)
+    kept_bytes = 0
+    for number, (stem, (_, size)) in enumerate(sorted(profiles.items(), key=lambda item: item[1][0], reverse=True)):
+        kept_bytes += size
+        if number >= max_profiles or kept_bytes > max_bytes:
+            for extension in EXTENSIONS:
+                try:
+                    os.remove(os.path.join(directory, stem + extension))
+                except FileNotFoundError:
+                    pass
+
+
+def init_profiling(app):
+    # PROFILING_ENABLED = True (staging, development; never production) profiles the requests sent with
+    # "X-Profile: <PROFILE_SECRET>". Each one leaves <id>.prof (cProfile, for snakeviz / pstats),
+    # <id>.collapsed (sampled stacks, for flamegraph.pl / speedscope) and <id>.json (SQL time per
+    # statement) in PROFILE_DIR. When it is off nothing is registered, so requests don't pay for it.
+    # Profile on sync workers: under gevent the .prof also counts the other greenlets that ran on the
+    # worker's thread meanwhile, and the sampled stacks only show where the request waited on I/O
+    if not app.config.get("PROFILING_ENABLED", False):
+        return
+    secret = app.config.get("PROFILE_SECRET")
+    if not secret:
+        logger.warning("PROFILING_ENABLED is set without a PROFILE_SECRET; profiling stays off")
+        return
+
+    directory = app.config.get("PROFILE_DIR") or os.path.join(app.instance_path, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    max_profiles = app.config.get("PROFILE_MAX_FILES", MAX_PROFILES)
+    max_bytes = app.config.get("PROFILE_MAX_BYTES", MAX_BYTES)
+    interval = app.config.get("PROFILE_SAMPLE_INTERVAL", SAMPLE_INTERVAL)
+    logger.warning("Request profiling is enabled", extra={"profile_dir": directory})
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    replica_router = app.extensions.get("replica_router")
+    if replica_router is not None:
+        engines += [replica.engine for replica in replica_router.replicas]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    def start_profile():
+        if not requested(secret):
+            return
+        if not _profiling.acquire(blocking=False):
+            logger.info("Another request is being profiled; serving this one unprofiled")
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler or debugger holds the hooks
+            _profiling.release()
+            logger.warning("Could not start the profiler", exc_info=True)
+            return
+        g.profiler = profiler
+        g.profile_sql = {}
+        g.profile_started = time.perf_counter()
+        g.profile_sampler = StackSampler(request_frame(), interval)
+        g.profile_sampler.start()
+
+    def finish_profile(status):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return None
+        try:
+            profiler.disable()
+            g.profile_sampler.stop()
+            return write_profile(profiler, status)
+        finally:
+            _profiling.release()
+
+    def write_profile(profiler, status):
+        duration = time.perf_counter() - g.profile_started
+
+        endpoint = re.sub(r"[^\w.-]", "_", request.endpoint or "unmatched")
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint}-{g.get('request_id') or uuid4().hex}"
+        path = os.path.join(directory, profile_id)
+        profiler.dump_stats(path + ".prof")
+        with open(path + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(g.profile_sampler.collapsed())
+        statements = sorted(g.pop("profile_sql").items(), key=lambda item: item[1][1], reverse=True)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "method": request.method,
+                "path": request.full_path,
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+                "sql_ms": round(sum(seconds for _, (_, seconds) in statements) * 1000, 3),
+                "sql_statements": sum(count for _, (count, _) in statements),
+                "statements": [{"statement": statement, "count": count, "ms": round(seconds * 1000, 3)}
+                               for statement, (count, seconds) in statements],
+            }, f, indent=2)
+        prune(directory, max_profiles, max_bytes)
+        return profile_id
+
+    # first in line, like the metrics timer, so the rate limiter and the other hooks show up too
+    app.before_request_funcs.setdefault(None, []).insert(0, start_profile)
+
+    @app.after_request
+    def add_profile_id(response):
+        profile_id = finish_profile(response.status_code)
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    @app.teardown_request
+    def write_failed_profile(error):
+        # after_request doesn't run when a view raises
+        if error is not None:
+            finish_profile(500)
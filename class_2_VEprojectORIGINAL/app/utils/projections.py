@@ -0,0 +1,98 @@
+from flask import request
+from sqlalchemy import select
+from app.models import db, Customers, Mechanic, Inventory, ServiceTickets, service_ticket_inventory
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+class Nested:
+    # a many-to-many child list, loaded for a whole batch of parents with one extra SELECT
+    def __init__(self, name, projection, parent_key, child_key):
+        self.name = name
+        self.projection = projection
+        self.parent_key = parent_key
+        self.child_key = child_key
+
+    def attach(self, items):
+        by_parent = {item["id"]: item for item in items}
+        for item in items:
+            item[self.name] = []
+
+        child_id = self.projection.table.c.id
+        query = (select(self.parent_key, *self.projection.columns)
+                 .join(self.projection.table, child_id == self.child_key)
+                 .where(self.parent_key.in_(by_parent))
+                 .order_by(self.parent_key, child_id))
+        for row in db.session.execute(query):
+            by_parent[row[0]][self.name].append(self.projection.row_to_dict(row[1:]))
+
+
+class Projection:
+    # selects only the listed columns with Core and maps rows straight to response dicts,
+    # skipping ORM identity-map and attribute instrumentation for read-only endpoints
+    def __init__(self, model, fields, formatters=None, nested=None):
+        self.model = model
+        self.table = model.__table__
+        self.fields = list(fields)
+        self.columns = [self.table.c[field] for field in self.fields]
+        self.formatters = [(field, formatter) for field, formatter in (formatters or {}).items() if field in self.fields]
+        self.nested = nested
+        self._subsets = {}
+
+    def only(self, fields):
+        # narrows both the SELECT list and the payload; the nested list is only loaded when it's asked
+        # for. "id" is always kept because cursors and the nested lookup are keyed on it
+        available = self.fields + ([self.nested.name] if self.nested else [])
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+
+        key = frozenset(fields) | {"id"}
+        if key not in self._subsets:
+            nested = self.nested if self.nested and self.nested.name in key else None
+            self._subsets[key] = Projection(self.model, [field for field in self.fields if field in key],
+                                            dict(self.formatters), nested)
+        return self._subsets[key]
+
+    def for_request(self):
+        # ?fields=id,vin_number,work_complete
+        fields = [field.strip() for field in request.args.get("fields", "").split(",") if field.strip()]
+        return self.only(fields) if fields else self
+
+    def select(self):
+        return select(*self.columns)
+
+    def row_to_dict(self, row):
+        item = dict(zip(self.fields, row))
+        for field, formatter in self.formatters:
+            item[field] = formatter(item[field])
+        return item
+
+    def rows_to_dicts(self, rows):
+        items = [self.row_to_dict(row) for row in rows]
+        if self.nested and items:
+            self.nested.attach(items)
+        return items
+
+    def all(self, query):
+        return self.rows_to_dicts(db.session.execute(query).all())
+
+
+customer_projection = Projection(Customers, [
+    "id", "name", "phone_number", "car_brand", "car_type", "car_mileage", "mechanical_issue"])
+
+mechanic_projection = Projection(Mechanic, [
+    "id", "mechanic_name", "email", "address", "phone_number", "salary"])
+
+inventory_projection = Projection(Inventory, ["id", "name", "price", "quantity"])
+inventory_search_projection = Projection(Inventory, ["id", "name", "price"])
+
+service_ticket_projection = Projection(
+    ServiceTickets,
+    ["id", "service_description", "cost", "vin_number", "work_complete",
+     "car_submission_date", "work_start_date", "work_finish_date"],
+    formatters={"car_submission_date": isoformat, "work_start_date": isoformat, "work_finish_date": isoformat},
+    nested=Nested("inventory_items", inventory_projection,
+                  service_ticket_inventory.c.service_ticket_id, service_ticket_inventory.c.inventory_id))
@@ -0,0 +1,77 @@
+import warnings
+from collections import Counter
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from app.models import db
+
+REPEAT_THRESHOLD = 3
+# transaction bookkeeping, which depends on the driver and on how the session joined its transaction
+# (the tests run inside a SAVEPOINT, tests/base.py); neither the budgets nor /metrics count it
+TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+def query_budget(statements):
+    # @query_budget(2) under the route decorator: the most SQL statements one request to the view may run.
+    # Checked when QUERY_BUDGETS_ENABLED is on (by default only under TESTING)
+    def decorator(f):
+        f.query_budget = statements
+        return f
+    return decorator
+
+
+def repeated_statements(statements, threshold):
+    return [(statement, count) for statement, count in Counter(statements).most_common() if count >= threshold]
+
+
+def describe(repeated):
+    return "\n".join(f"  {count}x {statement}" for statement, count in repeated)
+
+
+def log_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "query_log" in g and not statement.startswith(TRANSACTION_CONTROL):
+        g.query_log.append(statement)
+
+
+def init_query_budgets(app):
+    if not app.config.get("QUERY_BUDGETS_ENABLED", app.testing):
+        return
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    replica_router = app.extensions.get("replica_router")
+    if replica_router is not None:
+        engines += [replica.engine for replica in replica_router.replicas]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", log_statement)
+
+    @app.before_request
+    def start_query_log():
+        g.query_log = []
+
+    @app.after_request
+    def check_query_budget(response):
+        statements = g.pop("query_log", None)
+        if statements is None:
+            return response
+
+        threshold = current_app.config.get("QUERY_REPEAT_THRESHOLD", REPEAT_THRESHOLD)
+        repeated = repeated_statements(statements, threshold)
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, "query_budget", None)
+        if budget is not None and len(statements) > budget:
+            message = f"{request.method} {request.full_path} ran {len(statements)} SQL statements, budget is {budget}"
+            if repeated:
+                message += f"; repeated statements (likely N+1):\n{describe(repeated)}"
+            raise QueryBudgetExceeded(message)
+        if repeated:
+            warnings.warn(f"{request.method} {request.full_path} repeated statements (likely N+1):\n{describe(repeated)}",
+                          NPlusOneWarning)
+        return response
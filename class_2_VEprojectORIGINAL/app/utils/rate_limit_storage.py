@@ -0,0 +1,124 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+from limits.errors import ConfigurationError
+from limits.storage import Storage, MovingWindowSupport
+
+PURGE_PROBABILITY = 0.001
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expiry REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS window_entries (key TEXT NOT NULL, ts REAL NOT NULL, expiry REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_window_entries_key_ts ON window_entries (key, ts);
+CREATE INDEX IF NOT EXISTS ix_window_entries_expiry ON window_entries (expiry);
+"""
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    # rate limit counters in one SQLite file, so every gunicorn worker on the host shares them and they
+    # survive restarts. Registered as sqlite:///relative/path.db or sqlite:////absolute/path.db:
+    #   RATELIMIT_STORAGE_URI = "sqlite:////var/run/mechanic-shop/limits.db"
+    # Supports the fixed-window, fixed-window-elastic-expiry and moving-window strategies.
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, timeout=5.0, **options):
+        # an in-memory database would be private to each connection, so a file is required
+        self.path = urlparse(uri).path[1:]
+        if not self.path:
+            raise ConfigurationError("sqlite rate limit storage needs a file path, e.g. sqlite:////tmp/limits.db")
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # one connection per thread and per process (gunicorn forks after the app may have been loaded)
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            # WAL lets readers run alongside the single writer; NORMAL skips the fsync per commit
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        # one statement, so the read-modify-write is atomic across processes without an explicit lock
+        row = self._connection().execute(
+            "INSERT INTO counters (key, value, expiry) VALUES (:key, :amount, :expiry) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "value = CASE WHEN counters.expiry <= :now THEN :amount ELSE counters.value + :amount END, "
+            "expiry = CASE WHEN counters.expiry <= :now OR :elastic THEN :expiry ELSE counters.expiry END "
+            "RETURNING value",
+            {"key": key, "amount": amount, "expiry": now + expiry, "now": now, "elastic": elastic_expiry}).fetchone()
+        return row[0]
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ? AND expiry > ?", (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expiry FROM counters WHERE key = ? AND expiry > ?", (key, now)).fetchone()
+        return row[0] if row else now
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        connection = self._connection()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't both see room for the last entry
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM window_entries WHERE key = ? AND ts < ?", (key, now - expiry))
+            acquired = connection.execute("SELECT count(*) FROM window_entries WHERE key = ?", (key,)).fetchone()[0]
+            allowed = acquired + amount <= limit
+            if allowed:
+                connection.executemany("INSERT INTO window_entries (key, ts, expiry) VALUES (?, ?, ?)",
+                                       [(key, now, now + expiry)] * amount)
+            if random.random() < PURGE_PROBABILITY:
+                # keys that stopped getting traffic are only cleaned up here
+                connection.execute("DELETE FROM window_entries WHERE expiry < ?", (now,))
+                connection.execute("DELETE FROM counters WHERE expiry < ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        start, acquired = self._connection().execute(
+            "SELECT min(ts), count(*) FROM window_entries WHERE key = ? AND ts >= ?", (key, now - expiry)).fetchone()
+        return (start if start is not None else now), acquired
+
+    def check(self):
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        connection = self._connection()
+        removed = connection.execute("DELETE FROM counters").rowcount
+        removed += connection.execute("DELETE FROM window_entries").rowcount
+        return removed
+
+    def clear(self, key):
+        connection = self._connection()
+        connection.execute("DELETE FROM counters WHERE key = ?", (key,))
+        connection.execute("DELETE FROM window_entries WHERE key = ?", (key,))
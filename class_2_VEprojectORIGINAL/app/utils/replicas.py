@@ -0,0 +1,106 @@
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, request
+from sqlalchemy import create_engine, event, exc, text
+from app.models import db
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ("GET", "HEAD")
+HEALTH_CHECK_INTERVAL = 5
+REPLICA_LAG_WINDOW = 5
+
+
+class Replica:
+    def __init__(self, key, engine):
+        self.key = key
+        self.engine = engine
+        self.healthy = True
+        self.checked_at = None
+
+
+class ReplicaRouter:
+    # round-robin over the replicas that passed their last health check. A replica is re-checked with
+    # SELECT 1 at most every interval seconds, when its turn comes, by one request at a time; when
+    # none is healthy the session falls back to the primary
+    def __init__(self, replicas, interval=HEALTH_CHECK_INTERVAL):
+        self.replicas = replicas
+        self.interval = interval
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+        for replica in replicas:
+            event.listen(replica.engine, "handle_error", self._on_error(replica))
+
+    def _on_error(self, replica):
+        def handle_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+                self.mark_down(replica)
+        return handle_error
+
+    def mark_down(self, replica):
+        if replica.healthy:
+            logger.warning("Replica marked down", extra={"replica": replica.key})
+        replica.healthy = False
+        replica.checked_at = time.monotonic()
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except exc.SQLAlchemyError:
+            self.mark_down(replica)
+            return
+        if not replica.healthy:
+            logger.info("Replica back up", extra={"replica": replica.key})
+        replica.healthy = True
+        replica.checked_at = time.monotonic()
+
+    def choose(self):
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[next(self._turns) % len(self.replicas)]
+                now = time.monotonic()
+                due = replica.checked_at is None or now - replica.checked_at >= self.interval
+                if due:
+                    # claims the check: concurrent requests go on with the last result meanwhile
+                    replica.checked_at = now
+            if due:
+                self.check(replica)
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    def status(self):
+        return {replica.key: replica.healthy for replica in self.replicas}
+
+
+def use_primary_after_write(written_at):
+    # for reads whose result outlives the request (app/utils/caching.py). For REPLICA_LAG_WINDOW seconds
+    # after a write a replica may not have it yet, and its rows would be cached, and given an ETag, under
+    # the table versions of that write; until then the read goes to the primary. Set the window above
+    # the replicas' worst lag
+    window = current_app.config.get("REPLICA_LAG_WINDOW", REPLICA_LAG_WINDOW)
+    if time.time() - written_at < window:
+        db.session.info["read_only"] = False
+
+
+def init_replicas(app):
+    # SQLALCHEMY_REPLICA_URIS = ["mysql+mysqlconnector://...replica1", ...]. The engines are created here
+    # rather than as SQLALCHEMY_BINDS, which would give each one a metadata that create_all/drop_all
+    # walk; they get the same SQLALCHEMY_ENGINE_OPTIONS (pool settings) as the primary
+    uris = app.config.get("SQLALCHEMY_REPLICA_URIS", ())
+    if not uris:
+        return
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    replicas = [Replica(f"replica_{number}", create_engine(uri, **options)) for number, uri in enumerate(uris)]
+    app.extensions["replica_router"] = ReplicaRouter(
+        replicas, app.config.get("REPLICA_HEALTH_CHECK_INTERVAL", HEALTH_CHECK_INTERVAL))
+
+    @app.before_request
+    def route_reads_to_replicas():
+        # replicas lag the primary, so a client that has to read its own write should use the
+        # write's response rather than an immediate GET
+        db.session.info["read_only"] = request.method in READ_METHODS
+        db.session.info.pop("replica", None)
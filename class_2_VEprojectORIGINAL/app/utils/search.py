@@ -0,0 +1,127 @@
+import re
+import click
+from flask import request, current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DDL, event, func, inspect, literal_column, table as sql_table, column as sql_column
+from app.models import db, Customers, Mechanic, Inventory
+from app.utils.pagination import parse_limit
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# model -> the column its /search route matches against
+_fulltext_columns = {}
+
+
+def _sqlite_ddl(table, column):
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+
+def _postgresql_ddl(table, column):
+    return [f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_fts ON {table} "
+            f"USING gin (to_tsvector('simple', {column}))"]
+
+
+def _mysql_ddl(table, column):
+    return [f"CREATE FULLTEXT INDEX ft_{table}_{column} ON {table} ({column})"]
+
+
+_ddl_by_dialect = {
+    "sqlite": _sqlite_ddl,
+    "postgresql": _postgresql_ddl,
+    "mysql": _mysql_ddl,
+}
+
+
+def register_fulltext(model, column):
+    table = model.__table__
+    _fulltext_columns[model] = column
+
+    # the index is created with the table, so db.create_all() picks it up on every dialect
+    for dialect, build in _ddl_by_dialect.items():
+        for statement in build(table.name, column):
+            event.listen(table, "after_create", DDL(statement).execute_if(dialect=dialect))
+    # the FTS5 shadow table is not owned by the content table, so it has to be dropped alongside it
+    event.listen(table, "before_drop", DDL(f"DROP TABLE IF EXISTS {table.name}_fts").execute_if(dialect="sqlite"))
+
+
+register_fulltext(Customers, "name")
+register_fulltext(Mechanic, "mechanic_name")
+register_fulltext(Inventory, "name")
+
+
+def build_search_index():
+    # for databases created before full-text search existed; safe to run more than once
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    build = _ddl_by_dialect.get(dialect)
+    if build is None:
+        return
+
+    for model, column in _fulltext_columns.items():
+        table = model.__tablename__
+        if dialect == "mysql":
+            existing = {index["name"] for index in inspect(connection).get_indexes(table)}
+            if f"ft_{table}_{column}" in existing:
+                continue
+        for statement in build(table, column):
+            connection.exec_driver_sql(statement)
+        if dialect == "sqlite":
+            connection.exec_driver_sql(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+    db.session.commit()
+
+
+@click.command("build-search-index")
+@with_appcontext
+def build_search_index_command():
+    build_search_index()
+    click.echo("Full-text search index is up to date.")
+
+
+def get_search_limit():
+    default_limit = current_app.config.get("SEARCH_DEFAULT_LIMIT", DEFAULT_LIMIT)
+    max_limit = current_app.config.get("SEARCH_MAX_LIMIT", MAX_LIMIT)
+    return parse_limit(request.args.get("limit"), default_limit, max_limit)
+
+
+def fulltext_search(query, model, term):
+    # every word in the term must match as a prefix ("filt" finds "filtro")
+    words = re.findall(r"\w+", term)
+    limit = get_search_limit()
+    if not words:
+        return query.order_by(model.id).limit(limit)
+
+    column = getattr(model, _fulltext_columns[model])
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        fts_name = f"{model.__tablename__}_fts"
+        fts = sql_table(fts_name, sql_column("rowid"))
+        match = " ".join(f'"{word}"*' for word in words)
+        query = (query.join(fts, fts.c.rowid == model.id)
+                 .where(literal_column(fts_name).op("MATCH")(match))
+                 .order_by(func.bm25(literal_column(fts_name))))
+    elif dialect == "postgresql":
+        # the config is inlined so the expression matches the GIN index definition
+        config = literal_column("'simple'")
+        document = func.to_tsvector(config, column)
+        ts_query = func.to_tsquery(config, " & ".join(f"{word}:*" for word in words))
+        query = query.where(document.op("@@")(ts_query)).order_by(func.ts_rank(document, ts_query).desc())
+    elif dialect == "mysql":
+        match = column.match(" ".join(f"+{word}*" for word in words))
+        query = query.where(match).order_by(match.desc())
+    else:
+        query = query.where(column.like(f"%{term}%")).order_by(model.id)
+
+    return query.limit(limit)
@@ -0,0 +1,236 @@
+import gzip
+import itertools
+import json
+import random
+from datetime import date, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Date, delete, func, insert, select, text
+from app.models import db, Customers, Mechanic, Inventory, ServiceTickets, service_ticket_inventory
+from app.utils.caching import bump_versions
+
+CHUNK_SIZE = 5000
+SNAPSHOT_VERSION = 1
+
+FIRST_NAMES = ["Lucía", "Hugo", "Martina", "Mateo", "Sofía", "Leo", "María", "Daniel", "Julia", "Pablo",
+               "Paula", "Álvaro", "Valeria", "Manuel", "Carmen", "Javier", "Elena", "Adrián", "Noa", "Diego"]
+LAST_NAMES = ["García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez", "Pérez",
+              "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero"]
+CITIES = ["Granada", "Sevilla", "Madrid", "Valencia", "Bilbao", "Málaga", "Zaragoza", "Murcia"]
+# brand, world manufacturer identifier, models
+CARS = [("SEAT", "VSS", ["Ibiza", "León", "Arona"]), ("Volkswagen", "WVW", ["Golf", "Polo", "Passat"]),
+        ("Renault", "VF1", ["Clio", "Mégane", "Captur"]), ("Peugeot", "VF3", ["208", "308", "3008"]),
+        ("Toyota", "JTD", ["Corolla", "Yaris", "RAV4"]), ("BMW", "WBA", ["Serie 1", "Serie 3", "X1"]),
+        ("Fiat", "ZFA", ["500", "Panda", "Tipo"]), ("Honda", "1HG", ["Civic", "Accord", "CR-V"])]
+ISSUES = ["Ruido en los frenos", "El motor tiene dificultad para encender", "Cambio de aceite y filtros",
+          "Vibración al frenar", "Luz de motor encendida", "Revisión de los 30.000 km", "Fallo del aire acondicionado",
+          "Pérdida de líquido refrigerante", "Embrague patina", "Neumáticos desgastados"]
+PARTS = ["Pastillas de freno", "Disco de freno", "Filtro de aceite", "Filtro de aire", "Bujía", "Batería",
+         "Correa de distribución", "Amortiguador", "Embrague", "Aceite 5W30", "Radiador", "Bomba de agua",
+         "Alternador", "Motor de arranque", "Neumático", "Escobilla", "Sensor de oxígeno", "Termostato"]
+
+VIN_CHARACTERS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"
+# the same 33 characters, digits first, for the six-position serial: unique up to 33 ** 6 customers
+SERIAL_CHARACTERS = "0123456789ABCDEFGHJKLMNPRSTUVWXYZ"
+SERIAL_LENGTH = 6
+VIN_VALUES = {**{str(n): n for n in range(10)},
+              **dict(zip("ABCDEFGH", range(1, 9))), **dict(zip("JKLMN", range(1, 6))), "P": 7, "R": 9,
+              **dict(zip("STUVWXYZ", range(2, 10)))}
+VIN_WEIGHTS = [8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2]
+MODEL_YEARS = "ABCDEFGHJKLMNPRS"  # 2010 - 2025
+# visits per customer and how often each count happens; averages 2 tickets per customer
+TICKETS_PER_CUSTOMER = ([0, 1, 2, 3, 4, 6], [10, 30, 25, 15, 12, 8])
+PARTS_PER_TICKET = ([0, 1, 2, 3, 4], [15, 30, 30, 15, 10])
+
+
+def vin_check_digit(vin):
+    remainder = sum(VIN_VALUES[char] * weight for char, weight in zip(vin, VIN_WEIGHTS)) % 11
+    return "X" if remainder == 10 else str(remainder)
+
+
+def mix(n):
+    # cheap deterministic scramble, so a customer's car can be rebuilt from its id alone
+    return (n * 2654435761) % 4294967296
+
+
+def vin_serial(customer_id):
+    if customer_id >= len(SERIAL_CHARACTERS) ** SERIAL_LENGTH:
+        raise ValueError(f"customer id {customer_id} doesn't fit a {SERIAL_LENGTH}-position VIN serial")
+    digits = []
+    for _ in range(SERIAL_LENGTH):
+        customer_id, digit = divmod(customer_id, len(SERIAL_CHARACTERS))
+        digits.append(SERIAL_CHARACTERS[digit])
+    return "".join(reversed(digits))
+
+
+def customer_car(customer_id):
+    brand, wmi, models = CARS[mix(customer_id) % len(CARS)]
+    model = models[mix(customer_id + 1) % len(models)]
+    scrambled = mix(customer_id + 2)
+    descriptor = "".join(VIN_CHARACTERS[(scrambled >> (5 * n)) % len(VIN_CHARACTERS)] for n in range(5))
+    year = MODEL_YEARS[mix(customer_id + 3) % len(MODEL_YEARS)]
+    plant = VIN_CHARACTERS[mix(customer_id + 4) % 23]
+    vin = f"{wmi}{descriptor}0{year}{plant}{vin_serial(customer_id)}"
+    return brand, model, vin[:8] + vin_check_digit(vin) + vin[9:]
+
+
+def mechanics(rng, count):
+    for mechanic_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {"id": mechanic_id, "mechanic_name": f"{first} {last}", "email": f"mecanico{mechanic_id}@taller.es",
+               "address": f"Calle {rng.choice(LAST_NAMES)} {rng.randint(1, 200)}, {rng.choice(CITIES)}",
+               "phone_number": f"+34 6{rng.randint(10000000, 99999999)}",
+               "salary": round(rng.uniform(24000, 52000), -2)}
+
+
+def parts(rng, count):
+    for part_id in range(1, count + 1):
+        name = PARTS[(part_id - 1) % len(PARTS)]
+        if part_id > len(PARTS):
+            name += f" ref. {part_id:05d}"
+        yield {"id": part_id, "name": name, "price": round(rng.lognormvariate(3.5, 0.9), 2),
+               "quantity": rng.randint(0, 500)}
+
+
+def customers(rng, count):
+    for customer_id in range(1, count + 1):
+        brand, model, _ = customer_car(customer_id)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {"id": customer_id, "name": f"{first} {last} {rng.choice(LAST_NAMES)}",
+               "phone_number": f"+34 6{rng.randint(10000000, 99999999)}", "car_brand": brand, "car_type": model,
+               "car_mileage": int(rng.triangular(0, 300000, 60000)), "mechanical_issue": rng.choice(ISSUES),
+               "email": f"cliente{customer_id}@example.es", "password": f"clave{rng.randint(100000, 999999)}"}
+
+
+def tickets_and_links(rng, customer_count, mechanic_count, part_count, today):
+    # part usage follows a Zipf curve: a few consumables (pads, filters) show up on most tickets
+    cumulative, total = [], 0.0
+    for rank in range(1, part_count + 1):
+        total += 1 / rank ** 1.1
+        cumulative.append(total)
+    part_ids = range(1, part_count + 1)
+    ticket_id = 0
+    for customer_id in range(1, customer_count + 1):
+        _, _, vin = customer_car(customer_id)
+        for _ in range(rng.choices(*TICKETS_PER_CUSTOMER)[0]):
+            ticket_id += 1
+            submitted = today - timedelta(days=int(rng.triangular(0, 3 * 365, 30)))
+            started = submitted + timedelta(days=rng.randint(0, 5)) if rng.random() < 0.9 else None
+            finished = None
+            if started and rng.random() < 0.8:
+                finished = started + timedelta(days=rng.randint(0, 10))
+            ticket = {"id": ticket_id, "service_description": rng.choice(ISSUES),
+                      "cost": round(rng.lognormvariate(5, 0.8), 2), "vin_number": vin,
+                      "work_complete": finished is not None, "car_submission_date": submitted,
+                      "work_start_date": started, "work_finish_date": finished,
+                      "customer_id": customer_id, "mechanic_id": rng.randint(1, mechanic_count)}
+            used = set(rng.choices(part_ids, cum_weights=cumulative, k=rng.choices(*PARTS_PER_TICKET)[0]))
+            yield ticket, [{"service_ticket_id": ticket_id, "inventory_id": part_id} for part_id in sorted(used)]
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, size)):
+        yield chunk
+
+
+def generate(customer_count, seed, chunk_size, today):
+    # yields (table, rows) chunks in foreign key order; the same arguments always give the same rows
+    rng = random.Random(seed)
+    mechanic_count = max(3, customer_count // 200)
+    part_count = min(5000, max(50, customer_count // 20))
+    for table, rows in ((Mechanic.__table__, mechanics(rng, mechanic_count)),
+                        (Inventory.__table__, parts(rng, part_count)),
+                        (Customers.__table__, customers(rng, customer_count))):
+        for chunk in chunked(rows, chunk_size):
+            yield table, chunk
+    for chunk in chunked(tickets_and_links(rng, customer_count, mechanic_count, part_count, today), chunk_size):
+        yield ServiceTickets.__table__, [ticket for ticket, _ in chunk]
+        links = [link for _, ticket_links in chunk for link in ticket_links]
+        if links:
+            yield service_ticket_inventory, links
+
+
+def read_snapshot(path):
+    tables = {table.name: table for table in db.metadata.sorted_tables}
+    with gzip.open(path, "rt", encoding="utf-8") as snapshot:
+        header = json.loads(next(snapshot))
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise click.ClickException(f"{path} is not a version {SNAPSHOT_VERSION} snapshot")
+        for line in snapshot:
+            entry = json.loads(line)
+            table = tables[entry["table"]]
+            dates = [column.name for column in table.columns if isinstance(column.type, Date)]
+            for row in entry["rows"]:
+                for name in dates:
+                    if row[name] is not None:
+                        row[name] = date.fromisoformat(row[name])
+            yield table, entry["rows"]
+
+
+def load(chunks, snapshot_path=None, header=None):
+    snapshot = gzip.open(snapshot_path, "wt", encoding="utf-8") if snapshot_path else None
+    counts = {}
+    try:
+        if snapshot:
+            snapshot.write(json.dumps(header) + "\n")
+        for table, rows in chunks:
+            # Core executemany per chunk, committed as it goes so memory and transaction size stay flat
+            db.session.execute(insert(table), rows)
+            db.session.commit()
+            counts[table.name] = counts.get(table.name, 0) + len(rows)
+            if snapshot:
+                snapshot.write(json.dumps({"table": table.name, "rows": rows}, default=date.isoformat) + "\n")
+    finally:
+        if snapshot:
+            snapshot.close()
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        # explicit ids don't advance the serial sequences
+        for table in (Mechanic.__table__, Inventory.__table__, Customers.__table__, ServiceTickets.__table__):
+            db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                                    f"(SELECT coalesce(max(id), 1) FROM {table.name}))"))
+        db.session.commit()
+    return counts
+
+
+def reset_tables():
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(delete(table))
+    db.session.commit()
+
+
+def seed_database(customer_count=1000, seed=42, chunk_size=CHUNK_SIZE, snapshot_path=None, today=None):
+    today = today or date(2025, 6, 30)
+    header = {"version": SNAPSHOT_VERSION, "customers": customer_count, "seed": seed, "today": today.isoformat()}
+    return load(generate(customer_count, seed, chunk_size, today), snapshot_path, header)
+
+
+def load_snapshot(path):
+    return load(read_snapshot(path))
+
+
+@click.command("seed-data")
+@click.option("--customers", "customer_count", default=1000, show_default=True,
+              help="Customers to generate; tickets, mechanics and parts scale from it.")
+@click.option("--seed", default=42, show_default=True, help="Random seed; the same seed gives the same data.")
+@click.option("--chunk-size", default=CHUNK_SIZE, show_default=True, help="Rows per INSERT batch.")
+@click.option("--snapshot", "snapshot_path", type=click.Path(dir_okay=False), help="Also write the rows to this .jsonl.gz file.")
+@click.option("--from-snapshot", "from_snapshot", type=click.Path(exists=True, dir_okay=False), help="Load a snapshot instead of generating.")
+@click.option("--reset", is_flag=True, help="Delete the existing rows first.")
+@with_appcontext
+def seed_data_command(customer_count, seed, chunk_size, snapshot_path, from_snapshot, reset):
+    if reset:
+        reset_tables()
+    elif any(db.session.execute(select(func.count()).select_from(table)).scalar()
+             for table in db.metadata.sorted_tables):
+        raise click.ClickException("The tables already have rows; pass --reset to replace them.")
+
+    if from_snapshot:
+        counts = load_snapshot(from_snapshot)
+    else:
+        counts = seed_database(customer_count, seed, chunk_size, snapshot_path)
+    # the rows didn't go through the blueprints, so cached views wouldn't see them
+    bump_versions([table.name for table in db.metadata.sorted_tables])
+    for table, count in counts.items():
+        click.echo(f"{table}: {count} rows")
@@ -0,0 +1,56 @@
+from flask import Response, current_app, request, stream_with_context
+from app.models import db
+
+NDJSON = "application/x-ndjson"
+BATCH_SIZE = 1000
+
+
+def wants_stream():
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return request.accept_mimetypes.best == NDJSON
+
+
+def stream_batches(projection, query, batch_size):
+    if projection.nested is None:
+        # yield_per turns on server-side cursors where the driver has them, so only one batch of
+        # rows is alive at a time no matter how large the table is
+        result = db.session.execute(query.execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            yield projection.rows_to_dicts(rows)
+        return
+
+    # the nested child SELECT can't run while an unbuffered cursor is still open on the same
+    # connection (MySQL), so these batches are seeked by primary key instead
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.where(projection.table.c.id > last_id)
+        rows = db.session.execute(batch_query.limit(batch_size)).all()
+        if not rows:
+            return
+        yield projection.rows_to_dicts(rows)
+        last_id = rows[-1].id
+
+
+def stream_rows(projection, query):
+    # query must be ordered by primary key
+    batch_size = current_app.config.get("STREAM_BATCH_SIZE", BATCH_SIZE)
+    ndjson = request.accept_mimetypes.best == NDJSON or request.args.get("format") == "ndjson"
+    dumps = current_app.json.dumps
+
+    def generate():
+        batches = stream_batches(projection, query, batch_size)
+        if ndjson:
+            for batch in batches:
+                yield "".join(dumps(item) + "\n" for item in batch)
+            return
+
+        yield "["
+        separator = ""
+        for batch in batches:
+            for item in batch:
+                yield separator + dumps(item)
+                separator = ","
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON if ndjson else "application/json")
@@ -0,0 +1,44 @@
+import logging
+import os
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_CONNECTIONS = 1000
+MAX_DB_CONNECTIONS_PER_WORKER = 20
+
+
+def gevent_active():
+    # gunicorn's gevent worker monkey-patches before it loads the app
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def configure_gevent(app):
+    if not gevent_active():
+        return
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+
+    # every greenlet that is inside a view can hold a connection, so the pool follows worker_connections,
+    # capped by what the database can give each worker. Greenlets past the cap wait in pool checkout
+    # (pool_timeout) instead of piling up connections on the server. An explicit DB_POOL_SIZE /
+    # DB_MAX_OVERFLOW (app/utils/pool.py) wins.
+    connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", DEFAULT_WORKER_CONNECTIONS))
+    cap = app.config.get("DB_MAX_CONNECTIONS_PER_WORKER", MAX_DB_CONNECTIONS_PER_WORKER)
+    options.setdefault("pool_size", min(connections, cap))
+    options.setdefault("max_overflow", 0)
+
+    if url.get_backend_name() == "mysql" and url.get_driver_name() == "mysqlconnector":
+        # the C extension does its socket I/O outside Python, where monkey-patching can't reach it,
+        # and would block every greenlet in the worker; the pure-Python protocol yields on each read
+        options.setdefault("connect_args", {}).setdefault("use_pure", True)
+    elif url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg2":
+        # libpq is C as well; psycogreen switches psycopg2 to its wait callback so queries yield
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+    logger.info("gevent worker mode", extra={"pool_size": options["pool_size"], "worker_connections": connections})
@@ -0,0 +1,49 @@
+# Per-hit cost of the rate limit storages, and whether a limit holds across worker processes.
+#   python benchmarks/rate_limit_storage.py [hits] [processes]
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+import app.utils.rate_limit_storage  # registers sqlite://
+
+LIMIT = parse("200 per minute")
+
+
+def per_hit(storage_uri, strategy, hits):
+    limiter = strategy(storage_from_string(storage_uri))
+    started = time.perf_counter()
+    for n in range(hits):
+        # a spread of keys like a real client population, each well under the limit
+        limiter.hit(LIMIT, f"client-{n % 500}")
+    return (time.perf_counter() - started) / hits * 1_000_000
+
+
+def hit_shared_key(args):
+    storage_uri, hits = args
+    limiter = MovingWindowRateLimiter(storage_from_string(storage_uri))
+    return sum(limiter.hit(LIMIT, "shared") for _ in range(hits))
+
+
+def main():
+    hits = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    path = os.path.join(tempfile.mkdtemp(), "limits.db")
+    storages = {"memory": "memory://", "sqlite": f"sqlite:///{path}"}
+
+    for name, uri in storages.items():
+        for strategy in (FixedWindowRateLimiter, MovingWindowRateLimiter):
+            print(f"{name:<7} {strategy.__name__:<26} {per_hit(uri, strategy, hits):8.1f} us/hit")
+
+    # every process tries 200 hits against one 200/minute key: a shared storage lets exactly 200 through
+    for name, uri in storages.items():
+        with Pool(processes) as pool:
+            allowed = sum(pool.map(hit_shared_key, [(uri, LIMIT.amount)] * processes))
+        print(f"{name:<7} {processes} processes allowed {allowed} hits for a limit of {LIMIT.amount}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Compares the ORM read path the list routes used to take with the Core projection layer.
+# Runs against the 'testing' database:  python benchmarks/read_path.py [rows] [repeats]
+import sys
+import time
+from datetime import date
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from app import create_app
+from app.models import db, Customers, Inventory, ServiceTickets, service_ticket_inventory
+from app.utils.projections import customer_projection, service_ticket_projection
+
+
+def orm_customers():
+    return [{
+        "id": customer.id,
+        "name": customer.name,
+        "phone_number": customer.phone_number,
+        "car_brand": customer.car_brand,
+        "car_type": customer.car_type,
+        "car_mileage": customer.car_mileage,
+        "mechanical_issue": customer.mechanical_issue
+    } for customer in db.session.execute(select(Customers)).scalars()]
+
+
+def orm_tickets():
+    tickets = db.session.execute(select(ServiceTickets).options(selectinload(ServiceTickets.inventory_items))).scalars()
+    return [{
+        "id": ticket.id,
+        "service_description": ticket.service_description,
+        "cost": ticket.cost,
+        "vin_number": ticket.vin_number,
+        "work_complete": ticket.work_complete,
+        "car_submission_date": ticket.car_submission_date.isoformat(),
+        "work_start_date": ticket.work_start_date.isoformat() if ticket.work_start_date else None,
+        "work_finish_date": ticket.work_finish_date.isoformat() if ticket.work_finish_date else None,
+        "inventory_items": [{"id": item.id, "name": item.name, "price": item.price, "quantity": item.quantity}
+                            for item in ticket.inventory_items]
+    } for ticket in tickets]
+
+
+def core_customers():
+    return customer_projection.all(customer_projection.select())
+
+
+def core_tickets():
+    return service_ticket_projection.all(service_ticket_projection.select())
+
+
+def seed(rows):
+    db.session.execute(insert(Customers), [{
+        "name": f"Cliente {n}", "phone_number": "+34600000000", "car_brand": "SEAT", "car_type": "Ibiza",
+        "car_mileage": n, "mechanical_issue": "Ruido en el motor", "email": f"cliente{n}@example.es",
+        "password": "secreto"} for n in range(rows)])
+    db.session.execute(insert(Inventory), [{"name": f"Pieza {n}", "price": 10.0, "quantity": 100} for n in range(50)])
+    db.session.execute(insert(ServiceTickets), [{
+        "service_description": "Revisión", "cost": 120.0, "vin_number": f"1HGCM82633A{n:06d}", "work_complete": False,
+        "car_submission_date": date(2025, 1, 1), "customer_id": n + 1, "mechanic_id": 1} for n in range(rows)])
+    db.session.execute(insert(service_ticket_inventory), [
+        {"service_ticket_id": n + 1, "inventory_id": part + 1} for n in range(rows) for part in range(n % 3)])
+    db.session.commit()
+
+
+def timed(f, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    app = create_app("testing")
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            seed(rows)
+            assert orm_customers() == core_customers()
+            assert orm_tickets() == core_tickets()
+            for name, orm, core in [("customers", orm_customers, core_customers), ("tickets", orm_tickets, core_tickets)]:
+                orm_time, core_time = timed(orm, repeats), timed(core, repeats)
+                print(f"{name:10} {rows} rows  orm {orm_time * 1000:8.1f} ms  core {core_time * 1000:8.1f} ms  "
+                      f"speedup {orm_time / core_time:4.1f}x")
+        finally:
+            db.session.remove()
+            db.drop_all()
@@ -0,0 +1,233 @@
+# Replays the Postman collection as a weighted mix of concurrent scenarios against a local gunicorn and
+# reports throughput, p50/p95/p99 latency and error rates per request name. Seeds the database with
+# `flask seed-data` data first when it is empty:
+#   FLASK_SQLALCHEMY_DATABASE_URI=mysql+mysqlconnector://... python benchmarks/replay_postman.py --seconds 60 --clients 50
+#   python benchmarks/replay_postman.py --url http://127.0.0.1:5000 --weight "Get Inventory=40"
+# DELETE requests are left out unless given a weight, e.g. --weight "Delete Customer=1".
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit, parse_qsl
+from sqlalchemy import func, select
+from werkzeug.routing import RequestRedirect
+from app import create_app
+from app.models import db, Customers, Inventory, Mechanic, ServiceTickets
+from app.utils import encode_token
+from app.utils.seed import customer_car, seed_database
+
+COLLECTION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Module 2 Test.postman_collection.json")
+PORT = 8766
+# DELETEs thin out the seeded rows the other scenarios pick from, so they're opt-in
+METHOD_WEIGHTS = {"GET": 10, "POST": 2, "PUT": 2, "DELETE": 0}
+# the workflows clients run most; anything not listed falls back to METHOD_WEIGHTS
+DEFAULT_WEIGHTS = {"Get Customer LoginToken": 8, "Get Customers Tickets": 20, "Get Service Ticket": 15,
+                   "Search Service Ticket": 15, "Get Inventory Seach": 10, "Add Service Ticket Part": 5}
+# which table a route's <id> and a body's *_id refer to
+ID_TABLES = {"customer_bp": "customers", "mechanic_bp": "mechanics", "service_ticket_bp": "service_tickets",
+             "inventory_bp": "inventory", "customer_id": "customers", "mechanic_id": "mechanics",
+             "part_id": "inventory"}
+SAMPLES = 200
+
+
+class Scenario:
+    def __init__(self, name, method, path, query, body, auth, blueprint, weight):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+        self.auth = auth
+        self.blueprint = blueprint
+        self.weight = weight
+
+    def build(self, base_url, rng, data, unique):
+        # fills the collection's fixed ids, emails, VINs and tokens with values that exist in the seeded data
+        path = self.path.format(id=rng.randint(1, data.counts[ID_TABLES[self.blueprint]])) if self.blueprint else self.path
+        query = dict(self.query)
+        if "vin_number" in query:
+            query["vin_number"] = customer_car(rng.randint(1, data.counts["customers"]))[2]
+        body = dict(self.body) if self.body is not None else None
+        if body is not None:
+            if self.name == "Get Customer LoginToken":
+                body["email"], body["password"] = rng.choice(data.credentials)
+            elif "email" in body:
+                body["email"] = f"carga-{unique}@example.es"
+            for key in body.keys() & {"customer_id", "mechanic_id", "part_id"}:
+                body[key] = rng.randint(1, data.counts[ID_TABLES[key]])
+            if "vin_number" in body:
+                body["vin_number"] = customer_car(body.get("customer_id") or rng.randint(1, data.counts["customers"]))[2]
+        headers = {"Content-Type": "application/json"}
+        if self.auth:
+            headers["Authorization"] = f"Bearer {rng.choice(data.tokens)}"
+        return urllib.request.Request(base_url + path + (f"?{urlencode(query)}" if query else ""), method=self.method,
+                                      headers=headers, data=json.dumps(body).encode() if body is not None else None)
+
+
+class Data:
+    def __init__(self, counts, credentials, tokens):
+        self.counts = counts
+        self.credentials = credentials
+        self.tokens = tokens
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.client_errors = 0
+        self.errors = 0
+
+
+def load_scenarios(app, path, overrides):
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    urls = app.url_map.bind("localhost")
+    scenarios = []
+    for item in collection["item"]:
+        request = item["request"]
+        url = urlsplit(request["url"]["raw"] if isinstance(request["url"], dict) else request["url"])
+        route = url.path
+        try:
+            endpoint, view_args = urls.match(route, request["method"])
+        except RequestRedirect as redirect:
+            # the collection calls /customers where the route is /customers/
+            route = urlsplit(redirect.new_url).path
+            endpoint, view_args = urls.match(route, request["method"])
+        if "id" in view_args:
+            route = route.replace(f"/{view_args['id']}", "/{id}", 1)
+        raw = request.get("body", {}).get("raw", "").strip()
+        weight = overrides.get(item["name"], DEFAULT_WEIGHTS.get(item["name"], METHOD_WEIGHTS[request["method"]]))
+        if weight:
+            scenarios.append(Scenario(item["name"], request["method"], route, parse_qsl(url.query), json.loads(raw) if raw else None,
+                                      any(header["key"] == "Authorization" for header in request.get("header", [])),
+                                      endpoint.split(".")[0] if "id" in view_args else None, weight))
+    return scenarios
+
+
+def prepare_data(app, customers, seed):
+    with app.app_context():
+        db.create_all()
+        if not db.session.execute(select(func.count()).select_from(Customers)).scalar():
+            print(f"seeding {customers} customers ...")
+            seed_database(customers, seed)
+        counts = {table: db.session.execute(select(func.max(model.id))).scalar() or 1 for table, model in
+                  (("customers", Customers), ("mechanics", Mechanic), ("service_tickets", ServiceTickets), ("inventory", Inventory))}
+        credentials = [tuple(row) for row in db.session.execute(
+            select(Customers.email, Customers.password).order_by(Customers.id).limit(SAMPLES))]
+        tokens = [encode_token(customer_id) for customer_id in
+                  db.session.execute(select(Customers.id).order_by(Customers.id).limit(SAMPLES)).scalars()]
+        return Data(counts, credentials, tokens)
+
+
+def start_server(workers, worker_class):
+    # several workers need a cache they share (app/utils/caching.py)
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, FLASK_RATELIMIT_ENABLED="false", FLASK_LOG_REQUESTS="false",
+               FLASK_CACHE_TYPE="FileSystemCache", FLASK_CACHE_DIR=tempfile.mkdtemp())
+    server = subprocess.Popen(["gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{PORT}",
+                               "app:create_app('development')"], env=env, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{PORT}/inventory/", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def run_load(base_url, scenarios, data, seconds, clients, seed):
+    weights = list(itertools.accumulate(scenario.weight for scenario in scenarios))
+    # emails have to be unique across runs against the same database too. next() on a count() is
+    # safe from several threads; on a generator it raises "generator already executing"
+    run = int(time.time())
+    counter = itertools.count()
+    deadline = time.perf_counter() + seconds
+
+    def client(number):
+        rng = random.Random(seed * 1000 + number)
+        stats = {scenario.name: Stats() for scenario in scenarios}
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(scenarios, cum_weights=weights)[0]
+            request = scenario.build(base_url, rng, data, f"{run}-{next(counter)}")
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except urllib.error.HTTPError as error:
+                error.read()
+                if error.code >= 500:
+                    stats[scenario.name].errors += 1
+                else:
+                    stats[scenario.name].client_errors += 1
+            except OSError:
+                stats[scenario.name].errors += 1
+            stats[scenario.name].latencies.append(time.perf_counter() - started)
+        return stats
+
+    totals = {scenario.name: Stats() for scenario in scenarios}
+    with ThreadPoolExecutor(clients) as pool:
+        for stats in pool.map(client, range(clients)):
+            for name, result in stats.items():
+                totals[name].latencies += result.latencies
+                totals[name].client_errors += result.client_errors
+                totals[name].errors += result.errors
+    return totals
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+
+def report(totals, seconds):
+    everything = Stats()
+    print(f"{'request':<26}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'4xx %':>8}{'errors %':>10}")
+    for name, stats in list(totals.items()) + [("TOTAL", everything)]:
+        if name != "TOTAL":
+            everything.latencies += stats.latencies
+            everything.client_errors += stats.client_errors
+            everything.errors += stats.errors
+        if not stats.latencies:
+            continue
+        latencies = sorted(stats.latencies)
+        count = len(latencies)
+        print(f"{name:<26}{count:>8}{count / seconds:>9.1f}{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.95):>9.1f}"
+              f"{percentile(latencies, 0.99):>9.1f}{stats.client_errors / count * 100:>8.1f}{stats.errors / count * 100:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--url", help="target a server that is already running instead of starting gunicorn")
+    parser.add_argument("--customers", type=int, default=10000, help="rows to seed when the database is empty")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--collection", default=COLLECTION)
+    parser.add_argument("--weight", action="append", default=[], metavar="NAME=WEIGHT",
+                        help="override a request's weight; 0 leaves it out")
+    args = parser.parse_args()
+    overrides = {name: int(weight) for name, weight in (override.rsplit("=", 1) for override in args.weight)}
+
+    app = create_app("development")
+    scenarios = load_scenarios(app, args.collection, overrides)
+    data = prepare_data(app, args.customers, args.seed)
+    server = None if args.url else start_server(args.workers, args.worker_class)
+    try:
+        totals = run_load((args.url or f"http://127.0.0.1:{PORT}").rstrip("/"), scenarios, data, args.seconds, args.clients, args.seed)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    report(totals, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
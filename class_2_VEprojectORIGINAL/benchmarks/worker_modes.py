@@ -0,0 +1,94 @@
+# Throughput of sync vs gevent gunicorn workers on an I/O-bound endpoint (/customers/my-tickets).
+# Point it at the database you deploy on; the gain comes from overlapping the time spent waiting on it,
+# so against a database on the same host (sub-millisecond round trips) gevent is no faster than sync:
+#   FLASK_SQLALCHEMY_DATABASE_URI=mysql+mysqlconnector://... python benchmarks/worker_modes.py [seconds] [clients]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from sqlalchemy import insert
+from app import create_app
+from app.models import db, Customers, Mechanic, ServiceTickets
+from app.utils import encode_token
+
+PORT = 8765
+WORKERS = 2
+URL = f"http://127.0.0.1:{PORT}/customers/my-tickets"
+
+
+def seed():
+    app = create_app("development")
+    with app.app_context():
+        db.create_all()
+        # inserted_primary_key comes from the driver's lastrowid; mysql-connector has no RETURNING
+        mechanic_id = db.session.execute(insert(Mechanic.__table__), {
+            "mechanic_name": "Mecánico de carga", "email": f"mecanico{time.time_ns()}@taller.es",
+            "address": "Calle Mayor 1, Madrid", "phone_number": "+34600000001", "salary": 30000}).inserted_primary_key[0]
+        customer_id = db.session.execute(insert(Customers.__table__), {
+            "name": "Cliente de carga", "phone_number": "+34600000000", "car_brand": "SEAT", "car_type": "Ibiza",
+            "car_mileage": 1000, "mechanical_issue": "Ruido en el motor",
+            "email": f"carga{time.time_ns()}@example.es", "password": "secreto"}).inserted_primary_key[0]
+        db.session.execute(insert(ServiceTickets), [{
+            "service_description": "Revisión", "cost": 120.0, "vin_number": f"1HGCM82633A{n:06d}",
+            "work_complete": False, "car_submission_date": date(2025, 1, 1),
+            "customer_id": customer_id, "mechanic_id": mechanic_id} for n in range(20)])
+        db.session.commit()
+        return encode_token(customer_id)
+
+
+def start_server(worker_class):
+    # several workers need a cache they share (app/utils/caching.py)
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, FLASK_RATELIMIT_ENABLED="false", FLASK_LOG_REQUESTS="false",
+               FLASK_CACHE_TYPE="FileSystemCache", FLASK_CACHE_DIR=tempfile.mkdtemp())
+    server = subprocess.Popen(["gunicorn", "--workers", str(WORKERS), "--bind", f"127.0.0.1:{PORT}",
+                               "app:create_app('development')"], env=env, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{PORT}/inventory/", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def run_load(token, seconds, clients):
+    request = urllib.request.Request(URL, headers={"Authorization": f"Bearer {token}"})
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        latencies = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            with urllib.request.urlopen(request) as response:
+                response.read()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = [latency for result in pool.map(lambda _: client(), range(clients)) for latency in result]
+    latencies.sort()
+    return len(latencies) / seconds, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    token = seed()
+    for worker_class in ("sync", "gevent"):
+        server = start_server(worker_class)
+        try:
+            rps, p50, p99 = run_load(token, seconds, clients)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{worker_class:<7} {WORKERS} workers, {clients} clients: {rps:8.1f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# gunicorn reads this file from the working directory.
+#   sync (default):  gunicorn "app:create_app('development')"
+#   gevent:          GUNICORN_WORKER_CLASS=gevent GUNICORN_WORKER_CONNECTIONS=200 gunicorn "app:create_app('development')"
+# Worker count still comes from --workers / WEB_CONCURRENCY; with more than one, CACHE_TYPE must be a
+# shared cache (RedisCache, MemcachedCache, FileSystemCache).
+import os
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# the app sizes its connection pool from this (app/utils/workers.py), so the workers must see it
+os.environ["GUNICORN_WORKER_CONNECTIONS"] = str(worker_connections)
+
+if worker_class == "gevent":
+    # the worker monkey-patches when it starts; an app preloaded in the master would already hold
+    # unpatched sockets, locks and threads (the log listener, pool connections)
+    preload_app = False
+
+
+def on_starting(server):
+    # create_app refuses a per-process cache when there are several workers (app/utils/caching.py)
+    os.environ["GUNICORN_WORKERS"] = str(server.cfg.workers)
+    if server.cfg.preload_app:
+        # the app was loaded before this hook ran
+        from app.utils.caching import require_shared_cache
+        require_shared_cache(server.app.wsgi(), server.cfg.workers)
@@ -0,0 +1,124 @@
+import os
+import unittest
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, make_url
+from app import create_app, db
+from app.extensions import cache, limiter
+from app.models import RoutingSession
+from app.utils.log import stop_logging
+from config import TestingConfig
+
+_app = None
+
+
+def worker_database_uri(uri, worker):
+    # pytest -n auto runs the suite in workers gw0, gw1, ...; each gets its own database so they don't
+    # see each other's rows. For a server database, create testing_gw0, testing_gw1, ... beforehand
+    url = make_url(uri)
+    if not worker or not url.database or url.database == ":memory:":
+        return uri
+    if url.get_backend_name() == "sqlite":
+        root, extension = os.path.splitext(url.database)
+        return url.set(database=f"{root}_{worker}{extension}").render_as_string(hide_password=False)
+    return url.set(database=f"{url.database}_{worker}").render_as_string(hide_password=False)
+
+
+def sqlite_savepoints(engine):
+    # pysqlite opens transactions on its own and doesn't know about SAVEPOINT; let SQLAlchemy emit BEGIN
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        if connection.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+            connection.exec_driver_sql("BEGIN")
+
+    engine.dispose()
+
+
+def shared_app():
+    # one app and one schema per process (per pytest-xdist worker)
+    global _app
+    if _app is None:
+        os.environ["FLASK_SQLALCHEMY_DATABASE_URI"] = worker_database_uri(
+            TestingConfig.SQLALCHEMY_DATABASE_URI, os.environ.get("PYTEST_XDIST_WORKER"))
+        _app = create_app('testing')
+        with _app.app_context():
+            if db.engine.dialect.name == "sqlite":
+                sqlite_savepoints(db.engine)
+            db.drop_all()
+            db.create_all()
+    return _app
+
+
+class ConnectionSession(RoutingSession):
+    # bound to the test's connection, which wins over replica routing and Flask-SQLAlchemy's engine lookup
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(self.bind, Connection):
+            return self.bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def dispose_app(app):
+    stop_logging(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    if "replica_router" in app.extensions:
+        for replica in app.extensions["replica_router"].replicas:
+            replica.engine.dispose()
+
+
+def committed(test):
+    # for tests that need real commits (other connections, pool checkouts); the schema is rebuilt after
+    test.committed = True
+    return test
+
+
+class AppTestCase(unittest.TestCase):
+    # every test runs inside a transaction on one connection that is rolled back in tearDown; the
+    # session joins it with a SAVEPOINT, so the views' commits and rollbacks stay inside the test
+    def setUp(self):
+        self.app = shared_app()
+        self.saved_config = dict(self.app.config)
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        cache.clear()
+        limiter.reset()
+        if "metrics" in self.app.extensions:
+            self.app.extensions["metrics"].reset()
+
+        self.committed = getattr(getattr(self, self._testMethodName), "committed", False)
+        if not self.committed:
+            self.session_class = db.session.session_factory.class_
+            self.session_options = dict(db.session.session_factory.kw)
+            db.session.remove()
+            self.connection = db.engine.connect()
+            self.transaction = self.connection.begin()
+            db.session.session_factory.class_ = ConnectionSession
+            db.session.configure(bind=self.connection, join_transaction_mode="create_savepoint")
+
+    def create_app(self):
+        # an app of the test's own, e.g. built under patched FLASK_ settings; its engines and log
+        # listener go away with the test instead of piling up for the rest of the run
+        app = create_app('testing')
+        self.addCleanup(dispose_app, app)
+        return app
+
+    def tearDown(self):
+        db.session.remove()
+        if self.committed:
+            db.drop_all()
+            db.create_all()
+        else:
+            self.transaction.rollback()
+            self.connection.close()
+            db.session.session_factory.class_ = self.session_class
+            db.session.session_factory.kw.clear()
+            db.session.session_factory.kw.update(self.session_options)
+        # self.app may have been swapped for an app the test built
+        self.context.app.config.clear()
+        self.context.app.config.update(self.saved_config)
+        self.context.pop()
@@ -1,14 +1,19 @@
+import os
+import tempfile
 import unittest
-from app import create_app, db
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter
+from sqlalchemy import inspect
+from app import db
+from tests.base import AppTestCase, committed
+from app.utils import token_cache
+from app.utils.indexes import create_missing_indexes, DuplicateKeys
 
 
-class TestCustomers(unittest.TestCase):
+class TestCustomers(AppTestCase):
     def setUp(self):
-        self.app = create_app('testing')
-        self.client = self.app.test_client()
-        self.context = self.app.app_context()
-        self.context.push()
-        db.create_all()
+        super().setUp()
 
         self.client.post('/mechanics/', json={
             "mechanic_name": "Diego López",
@@ -31,11 +36,6 @@ class TestCustomers(unittest.TestCase):
         self.customer_id = customer_response.get_json()["id"]
         self.token = self.get_auth_token()
 
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.context.pop()
-
     def get_auth_token(self):
         response = self.client.post('/customers/login', json={
             "email": "GranadaEspana@gmail.es",
@@ -62,6 +62,64 @@ class TestCustomers(unittest.TestCase):
         response = self.client.post('/customers/', json=payload)
         self.assertEqual(response.status_code, 400)
 
+    def test_create_customer_duplicate_email(self):
+        response = self.client.post('/customers/', json={
+            "name": "Otra Basilia",
+            "phone_number": "+34305975932",
+            "car_brand": "SEAT",
+            "car_type": "Coupe",
+            "car_mileage": 1000,
+            "mechanical_issue": "Ruido en los frenos",
+            "email": "GranadaEspana@gmail.es",
+            "password": "jamon"})
+        self.assertEqual(response.status_code, 409)
+
+    def test_bulk_create_customers_rejects_taken_emails(self):
+        customer = {
+            "name": "Juan Fernández",
+            "phone_number": "+34987654321",
+            "car_brand": "Audi",
+            "car_type": "Sedán",
+            "car_mileage": 28000,
+            "mechanical_issue": "El motor tiene dificultad para encender",
+            "password": "autoJuan12"}
+        response = self.client.post('/customers/bulk', json=[
+            {**customer, "email": "juan.fernandez@gmail.es"},
+            {**customer, "email": "GranadaEspana@gmail.es"},
+            {**customer, "email": "juan.fernandez@gmail.es"}])
+        self.assertEqual(response.status_code, 207)
+        data = response.get_json()
+        self.assertEqual([row["index"] for row in data["created"]], [0])
+        self.assertEqual(sorted(data["errors"]), ["1", "2"])
+
+    @committed
+    def test_create_missing_indexes(self):
+        db.session.execute(db.text("DROP INDEX ix_customers_email"))
+        db.session.commit()
+
+        statements = create_missing_indexes()
+        self.assertEqual(len(statements), 1)
+        self.assertIn("ix_customers_email", statements[0])
+        index_names = {index["name"] for index in inspect(db.engine).get_indexes("customers")}
+        self.assertIn("ix_customers_email", index_names)
+        self.assertEqual(create_missing_indexes(), [])
+
+    @committed
+    def test_create_indexes_reports_duplicates_first(self):
+        db.session.execute(db.text("DROP INDEX ix_customers_email"))
+        columns = "name, phone_number, car_brand, car_type, car_mileage, mechanical_issue, email, password"
+        db.session.execute(db.text(f"INSERT INTO customers ({columns}) SELECT {columns} FROM customers"))
+        db.session.commit()
+
+        with self.assertRaises(DuplicateKeys) as raised:
+            create_missing_indexes()
+        self.assertEqual(raised.exception.duplicates, {"ix_customers_email": [(("GranadaEspana@gmail.es",), 2)]})
+        result = self.app.test_cli_runner().invoke(args=['create-indexes'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("GranadaEspana@gmail.es: 2 rows", result.output)
+        index_names = {index["name"] for index in inspect(db.engine).get_indexes("customers")}
+        self.assertNotIn("ix_customers_email", index_names)
+
     def test_get_customers(self):
         response = self.client.get('/customers?page=1&per_page=3')
         self.assertEqual(response.status_code, 200)
@@ -69,6 +127,36 @@ class TestCustomers(unittest.TestCase):
         self.assertIn("customers", data)
         self.assertLessEqual(len(data["customers"]), 3)
 
+    def test_get_customers_next_cursor(self):
+        self.client.post('/customers/', json={
+            "name": "Juan Fernández",
+            "phone_number": "+34987654321",
+            "car_brand": "Audi",
+            "car_type": "Sedán",
+            "car_mileage": 28000,
+            "mechanical_issue": "El motor tiene dificultad para encender",
+            "email": "juan.fernandez@gmail.es",
+            "password": "autoJuan12"})
+
+        response = self.client.get('/customers/?limit=1')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(len(data["customers"]), 1)
+        self.assertNotIn("total", data)
+        self.assertIsNotNone(data["next_cursor"])
+
+        response = self.client.get(f'/customers/?limit=1&include_total=1&cursor={data["next_cursor"]}')
+        data = response.get_json()
+        self.assertEqual(data["customers"][0]["name"], "Juan Fernández")
+        self.assertEqual(data["total"], 2)
+        self.assertIsNone(data["next_cursor"])
+
+    def test_login_keeps_cached_customers(self):
+        etag = self.client.get('/customers/search?name=Basilia').headers["ETag"]
+        self.get_auth_token()
+        response = self.client.get('/customers/search?name=Basilia', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
     def test_search_customer(self):
         response = self.client.get('/customers/search?name=Basilia')
         self.assertEqual(response.status_code, 200)
@@ -76,6 +164,10 @@ class TestCustomers(unittest.TestCase):
         self.assertGreater(len(data), 0)
         self.assertEqual(data[0]["name"], "Basilia Millian")
 
+    def test_search_customer_invalid_limit(self):
+        for limit in ("abc", "0", "-1"):
+            self.assertEqual(self.client.get(f'/customers/search?name=Basilia&limit={limit}').status_code, 400)
+
     def test_update_customer(self):
         response = self.client.put(f'/customers/{self.customer_id}', json={
             "name": "Basilia Carmen Millian",
@@ -85,6 +177,23 @@ class TestCustomers(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.get_json()["phone_number"], "+34987654321")
 
+    def test_update_customer_duplicate_email(self):
+        response = self.client.post('/customers/', json={
+            "name": "Juan Fernández",
+            "phone_number": "+34987654321",
+            "car_brand": "Audi",
+            "car_type": "Sedán",
+            "car_mileage": 28000,
+            "mechanical_issue": "El motor tiene dificultad para encender",
+            "email": "juan.fernandez@gmail.com",
+            "password": "autoJuan12"})
+        response = self.client.put(f'/customers/{response.get_json()["id"]}', json={
+            "name": "Juan Fernández",
+            "phone_number": "+34987654321",
+            "email": "GranadaEspana@gmail.es",
+            "password": "autoJuan12"})
+        self.assertEqual(response.status_code, 409)
+
     def test_update_customer_negative(self):
         response = self.client.put('/customers/9999', json={
             "name": "Invalid Customer",
@@ -160,6 +269,34 @@ class TestCustomers(unittest.TestCase):
         self.assertEqual(response.status_code, 403)
         self.assertIn("Invalid token", response.get_json()["error"])
 
+    def test_token_cache_hits_and_secret_rotation(self):
+        token_cache.clear()
+        headers = {"Authorization": f"Bearer {self.token}"}
+        before = token_cache.stats()
+        for _ in range(3):
+            self.assertEqual(self.client.get('/customers/my-tickets', headers=headers).status_code, 200)
+        after = token_cache.stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 2)
+
+        # a rotated secret must not accept tokens that were verified under the old one
+        self.app.config["JWT_SECRET_KEY"] = "rotated"
+        response = self.client.get('/customers/my-tickets', headers=headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(token_cache.stats()["size"], 0)
+
+    def test_sqlite_rate_limit_storage_is_shared(self):
+        path = os.path.join(tempfile.mkdtemp(), "limits.db")
+        # two storages on one file stand in for two gunicorn workers
+        first = MovingWindowRateLimiter(storage_from_string(f"sqlite:///{path}"))
+        second = MovingWindowRateLimiter(storage_from_string(f"sqlite:///{path}"))
+        item = parse("15 per hour")
+
+        hits = [limiter.hit(item, "127.0.0.1") for limiter in (first, second) * 10]
+        self.assertEqual(hits.count(True), 15)
+        self.assertFalse(hits[-1])
+        self.assertEqual(second.get_window_stats(item, "127.0.0.1").remaining, 0)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
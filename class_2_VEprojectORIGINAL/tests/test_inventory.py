@@ -1,19 +1,20 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from sqlalchemy import create_engine, event, insert, select
 from app import create_app, db
+from tests.base import AppTestCase, committed
+from app.models import Inventory
+from app.utils.pool import pool_stats
+from app.utils.replicas import Replica, ReplicaRouter
 
-class TestInventory(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.client = self.app.test_client()
-        self.context = self.app.app_context()
-        self.context.push()
-        db.create_all()
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.context.pop()
-
+class TestInventory(AppTestCase):
     def test_create_inventory(self):
         payload = {
             "name": "filtro de aceite",
@@ -33,6 +34,26 @@ class TestInventory(unittest.TestCase):
         response = self.client.post('/inventory/', json=payload)
         self.assertEqual(response.status_code, 400)
 
+    def test_bulk_create_inventory(self):
+        response = self.client.post('/inventory/bulk', json=[
+            {"name": "filtro de aceite", "price": 11.39, "quantity": 50},
+            {"name": "bujía"},
+            {"name": "pastillas de freno", "price": 45.0}])
+        self.assertEqual(response.status_code, 207)
+        data = response.get_json()
+        self.assertEqual([row["index"] for row in data["created"]], [0, 2])
+        self.assertIn("price", data["errors"]["1"])
+
+        items = self.client.get('/inventory/').get_json()
+        self.assertEqual([item["id"] for item in items], [row["id"] for row in data["created"]])
+        self.assertEqual(items[1]["quantity"], 0)
+
+    def test_bulk_create_inventory_negative(self):
+        response = self.client.post('/inventory/bulk', json={"name": "filtro de aceite", "price": 11.39})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/inventory/bulk', json=[{"name": "filtro de aceite"}])
+        self.assertEqual(response.status_code, 400)
+
     def test_get_inventory(self):
         self.client.post('/inventory/', json={
             "name": "filtro de aceite",
@@ -43,6 +64,82 @@ class TestInventory(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertGreater(len(response.get_json()), 0)
 
+    def test_get_inventory_stream(self):
+        for n in range(3):
+            self.client.post('/inventory/', json={"name": f"bujía {n}", "price": 4.5, "quantity": 10})
+
+        response = self.client.get('/inventory/', headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["bujía 0", "bujía 1", "bujía 2"])
+
+        response = self.client.get('/inventory/?stream=1')
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(len(response.get_json()), 3)
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_get_inventory_cached_until_write(self):
+        item_id = self.client.post('/inventory/', json={"name": "filtro de aceite", "price": 11.39, "quantity": 50}).get_json()["id"]
+        self.assertEqual(self.client.get('/inventory/').get_json()[0]["quantity"], 50)
+
+        # a change that bypasses the API is not seen until the next write through the blueprint
+        db.session.execute(db.text("UPDATE inventory SET quantity = 1"))
+        db.session.commit()
+        self.assertEqual(self.client.get('/inventory/').get_json()[0]["quantity"], 50)
+        self.assertEqual(self.client.get('/inventory/?limit=5').get_json()[0]["quantity"], 1)
+
+        self.client.put(f'/inventory/{item_id}', json={"name": "filtro de aceite", "price": 11.39, "quantity": 7})
+        self.assertEqual(self.client.get('/inventory/').get_json()[0]["quantity"], 7)
+        self.assertEqual(self.client.get('/inventory/search?name=filtro').get_json()[0]["price"], 11.39)
+
+    def test_get_inventory_conditional_get(self):
+        item_id = self.client.post('/inventory/', json={"name": "filtro de aceite", "price": 11.39, "quantity": 50}).get_json()["id"]
+        response = self.client.get('/inventory/')
+        etag = response.headers["ETag"]
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            response = self.client.get('/inventory/', headers={"If-None-Match": etag})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+        self.assertEqual(statements, [])
+
+        self.client.delete(f'/inventory/{item_id}')
+        response = self.client.get('/inventory/', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_inventory_if_modified_since(self):
+        with mock.patch("app.utils.caching.time") as clock:
+            clock.time.return_value = 1000.2
+            item_id = self.client.post('/inventory/', json={"name": "filtro de aceite", "price": 11.39, "quantity": 50}).get_json()["id"]
+            # the second of the write isn't over yet
+            self.assertNotIn("Last-Modified", self.client.get('/inventory/').headers)
+
+            clock.time.return_value = 1001.5
+            modified = self.client.get('/inventory/').headers["Last-Modified"]
+            self.assertEqual(self.client.get('/inventory/', headers={"If-Modified-Since": modified}).status_code, 304)
+
+            # a write in the second Last-Modified names is still newer than it
+            clock.time.return_value = 1001.7
+            self.client.put(f'/inventory/{item_id}', json={"name": "filtro de aceite", "price": 11.39, "quantity": 7})
+            response = self.client.get('/inventory/', headers={"If-Modified-Since": modified})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()[0]["quantity"], 7)
+
+    def test_per_process_cache_refused_with_several_workers(self):
+        with mock.patch.dict(os.environ, {"GUNICORN_WORKERS": "4"}):
+            with self.assertRaises(RuntimeError):
+                create_app('testing')
+
     def test_search_inventory(self):
         self.client.post('/inventory/', json={
             "name": "filtro de aceite",
@@ -55,6 +152,28 @@ class TestInventory(unittest.TestCase):
         self.assertGreater(len(data), 0)
         self.assertEqual(data[0]["name"], "filtro de aceite")
 
+    def test_search_inventory_follows_updates_and_deletes(self):
+        item_id = self.client.post('/inventory/', json={
+            "name": "filtro de aceite",
+            "price": 11.39,
+            "quantity": 50}).get_json()["id"]
+        self.client.post('/inventory/', json={
+            "name": "pastillas de freno",
+            "price": 45.0,
+            "quantity": 8})
+
+        self.client.put(f'/inventory/{item_id}', json={
+            "name": "filtro de aire",
+            "price": 9.99,
+            "quantity": 20})
+        self.assertEqual(self.client.get('/inventory/search?name=aceite').get_json(), [])
+        data = self.client.get('/inventory/search?name=filt aire').get_json()
+        self.assertEqual([item["name"] for item in data], ["filtro de aire"])
+
+        self.client.delete(f'/inventory/{item_id}')
+        self.assertEqual(self.client.get('/inventory/search?name=filtro').get_json(), [])
+        self.assertEqual(len(self.client.get('/inventory/search?name=&limit=5').get_json()), 1)
+
     def test_update_inventory(self):
         response = self.client.post('/inventory/', json={
             "name": "filtro de aceite",
@@ -100,6 +219,171 @@ class TestInventory(unittest.TestCase):
         response = self.client.delete('/inventory/9999')
         self.assertEqual(response.status_code, 404)
 
+    def test_get_inventory_cursor_pagination(self):
+        for n in range(5):
+            self.client.post('/inventory/', json={
+                "name": f"bujía {n}",
+                "price": 4.5,
+                "quantity": 10})
+
+        seen = []
+        url = '/inventory/?limit=2&include_total=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["X-Total-Count"], "5")
+            page = response.get_json()
+            self.assertLessEqual(len(page), 2)
+            seen.extend(item["name"] for item in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            url = f'/inventory/?limit=2&include_total=1&cursor={cursor}' if cursor else None
+
+        self.assertEqual(seen, [f"bujía {n}" for n in range(5)])
+
+    def test_get_inventory_invalid_cursor(self):
+        response = self.client.get('/inventory/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_inventory_invalid_limit(self):
+        for limit in ("0", "-3", "many"):
+            self.assertEqual(self.client.get(f'/inventory/?limit={limit}').status_code, 400)
+
+    @committed
+    def test_pool_settings_and_stats(self):
+        options = self.app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertIsInstance(db.engine.pool, options["poolclass"])
+        before = pool_stats()["checkouts"]
+        for limit in range(1, 4):
+            self.assertEqual(self.client.get(f'/inventory/?limit={limit}').status_code, 200)
+            # the test's app context keeps the session (and its connection) across requests
+            db.session.remove()
+
+        stats = pool_stats()
+        self.assertGreaterEqual(stats["checkouts"] - before, 3)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checkout_timeouts"], 0)
+
+    @committed
+    def test_reads_are_routed_to_healthy_replicas(self):
+        directory = tempfile.mkdtemp()
+        replicas = [f"sqlite:///{directory}/replica{n}.db" for n in range(2)] + [f"sqlite:///{directory}/missing/replica.db"]
+        with mock.patch.dict(os.environ, {"FLASK_SQLALCHEMY_REPLICA_URIS": json.dumps(replicas)}):
+            app = self.create_app()
+        client = app.test_client()
+
+        for n, replica in enumerate(app.extensions["replica_router"].replicas[:2]):
+            db.metadata.create_all(replica.engine)
+            with replica.engine.begin() as connection:
+                connection.execute(insert(Inventory), {"name": f"replica {n}", "price": 1.0, "quantity": 1})
+
+        response = client.post('/inventory/', json={"name": "primary", "price": 1.0, "quantity": 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(db.session.execute(select(Inventory.name)).scalars().all(), ["primary"])
+
+        # round robin over the two healthy replicas; the third can't be opened and is skipped
+        names = [client.get(f'/inventory/?limit={limit}&stream=1').get_json()[0]["name"] for limit in range(1, 5)]
+        self.assertEqual(names, ["replica 0", "replica 1", "replica 0", "replica 1"])
+        self.assertEqual(app.extensions["replica_router"].status(),
+                         {"replica_0": True, "replica_1": True, "replica_2": False})
+        # right after a write, responses that get cached are read from the primary
+        self.assertEqual(client.get('/inventory/').get_json()[0]["name"], "primary")
+
+        # once the replicas have had time to catch up, cached lists are read from them too
+        statements = []
+        event.listen(app.extensions["replica_router"].replicas[0].engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        app.config["REPLICA_LAG_WINDOW"] = 0
+        response = client.get('/inventory/?limit=9')
+        self.assertEqual(response.get_json()[0]["name"], "replica 0")
+        self.assertTrue(any("FROM inventory" in statement for statement in statements))
+        # and kept: the next request is a cache hit
+        executed = len(statements)
+        self.assertEqual(client.get('/inventory/?limit=9').get_json(), response.get_json())
+        self.assertEqual(len(statements), executed)
+
+    def test_replica_is_checked_by_one_request_at_a_time(self):
+        replica = Replica("replica_0", create_engine("sqlite://"))
+        router = ReplicaRouter([replica])
+        checks = []
+        started = threading.Event()
+
+        def slow_check(replica):
+            checks.append(replica.key)
+            started.set()
+            time.sleep(0.2)
+
+        with mock.patch.object(router, "check", slow_check):
+            checker = threading.Thread(target=router.choose)
+            checker.start()
+            started.wait()
+            # the replica is still healthy from its last check, so it's used without a second one
+            self.assertIs(router.choose(), replica.engine)
+            checker.join()
+        self.assertEqual(checks, ["replica_0"])
+
+    @committed
+    def test_profiling_is_opt_in_with_retention(self):
+        directory = tempfile.mkdtemp()
+        with mock.patch.dict(os.environ, {"FLASK_PROFILING_ENABLED": "true", "FLASK_PROFILE_DIR": directory,
+                                          "FLASK_PROFILE_MAX_FILES": "2", "FLASK_PROFILE_SECRET": "s3cret"}):
+            app = self.create_app()
+        client = app.test_client()
+        client.post('/inventory/', json={"name": "filtro de aceite", "price": 11.39, "quantity": 50})
+        # the header has to carry the secret
+        client.get('/inventory/', headers={"X-Profile": "1"})
+        self.assertEqual(os.listdir(directory), [])
+
+        profile_ids = [client.get(f'/inventory/?limit={limit}', headers={"X-Profile": "s3cret"}).headers["X-Profile-Id"]
+                       for limit in range(1, 3)]
+        profile_ids.append(client.get('/inventory/search?name=filtro', headers={"X-Profile": "s3cret"}).headers["X-Profile-Id"])
+        kept = {os.path.splitext(name)[0] for name in os.listdir(directory)}
+        self.assertEqual(len(kept), 2)
+        self.assertIn(profile_ids[-1], kept)
+
+        path = os.path.join(directory, profile_ids[-1])
+        self.assertGreater(pstats.Stats(path + ".prof").total_calls, 0)
+        self.assertTrue(os.path.exists(path + ".collapsed"))
+        with open(path + ".json") as f:
+            summary = json.load(f)
+        self.assertEqual(summary["status"], 200)
+        self.assertGreaterEqual(summary["sql_statements"], 1)
+        self.assertLessEqual(summary["sql_ms"], summary["duration_ms"])
+
+        # the app built from TestingConfig has profiling off
+        self.assertNotIn("X-Profile-Id", self.client.get('/inventory/', headers={"X-Profile": "s3cret"}).headers)
+
+    @committed
+    def test_overlapping_profiled_requests(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.dict(os.environ, {"FLASK_PROFILING_ENABLED": "true", "FLASK_PROFILE_DIR": directory,
+                                          "FLASK_PROFILE_SECRET": "s3cret"}):
+            app = self.create_app()
+        entered, release = threading.Event(), threading.Event()
+
+        def slow():
+            entered.set()
+            release.wait(5)
+            return "done"
+
+        app.add_url_rule('/slow', 'slow', slow)
+        responses = []
+        first = threading.Thread(target=lambda: responses.append(
+            app.test_client().get('/slow', headers={"X-Profile": "s3cret"})))
+        first.start()
+        entered.wait(5)
+        # served, just not profiled, while the first request holds the profiler
+        response = app.test_client().get('/inventory/', headers={"X-Profile": "s3cret"})
+        release.set()
+        first.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertIn("X-Profile-Id", responses[0].headers)
+        # and the next one is profiled again
+        self.assertIn("X-Profile-Id", app.test_client().get('/inventory/', headers={"X-Profile": "s3cret"}).headers)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,19 +1,13 @@
+import io
+import json
+import logging
+import os
 import unittest
-from app import create_app, db
-
-class TestMechanics(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.client = self.app.test_client()
-        self.context = self.app.app_context()
-        self.context.push()
-        db.create_all()
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.context.pop()
+from unittest import mock
+from tests.base import AppTestCase
+from app.utils.log import JsonFormatter
 
+class TestMechanics(AppTestCase):
     def test_create_mechanic(self):
         payload = {
             "mechanic_name": "Alberto Millian",
@@ -26,11 +20,50 @@ class TestMechanics(unittest.TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertIn("message", response.get_json())
 
+    def test_structured_request_logging(self):
+        listener = self.app.extensions["log_listener"]
+        stream = io.StringIO()
+        capture = logging.StreamHandler(stream)
+        capture.setFormatter(JsonFormatter())
+        # earlier tests' records go to the real handler first
+        listener.queue.join()
+        self.addCleanup(setattr, listener, "handlers", listener.handlers)
+        listener.handlers = (capture,)
+
+        response = self.client.post('/mechanics/', json={"mechanic_name": "Alberto Millian"},
+                                    headers={"X-Request-ID": "req-123"})
+        self.assertEqual(response.headers["X-Request-ID"], "req-123")
+        self.assertTrue(self.client.get('/mechanics/').headers["X-Request-ID"])
+
+        listener.queue.join()
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([(r["request_id"], r["method"], r["status"]) for r in records][0], ("req-123", "POST", 400))
+        self.assertEqual(len(records), 2)
+        self.assertIn("duration_ms", records[0])
+
+    def test_get_mechanics_rejects_page(self):
+        response = self.client.get('/mechanics/?page=2&per_page=2')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.get_json()["message"])
+        self.assertEqual(self.client.get('/mechanics/?per_page=2').status_code, 200)
+
     def test_create_mechanic_negative(self):
         payload = {"mechanic_name": "Alberto Millian"}
         response = self.client.post('/mechanics/', json=payload)
         self.assertEqual(response.status_code, 400)
 
+    def test_bulk_create_mechanics(self):
+        response = self.client.post('/mechanics/bulk', json=[{
+            "mechanic_name": f"Mecánico {n}",
+            "email": f"mecanico{n}@taller.es",
+            "address": "Calle Mayor, 1, Sevilla",
+            "phone_number": "+34954000000",
+            "salary": 30000 + n} for n in range(3)])
+        self.assertEqual(response.status_code, 201)
+        data = response.get_json()
+        self.assertEqual(len(data["created"]), 3)
+        self.assertEqual(data["errors"], {})
+
     def test_get_mechanics(self):
         self.client.post('/mechanics/', json={
             "mechanic_name": "Alberto Millian",
@@ -57,6 +90,18 @@ class TestMechanics(unittest.TestCase):
         self.assertGreater(len(data), 0)
         self.assertEqual(data[0]["mechanic_name"], "Alberto Millian")
 
+    def test_search_mechanic_ignores_accents(self):
+        self.client.post('/mechanics/', json={
+            "mechanic_name": "Diego López",
+            "email": "diego.lopez@tallereslopez.es",
+            "address": "Calle Real, 45, Madrid, España",
+            "phone_number": "+34954321678",
+            "salary": 35000})
+
+        response = self.client.get('/mechanics/search?mechanic_name=lopez')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]["mechanic_name"], "Diego López")
+
     def test_update_mechanic(self):
         response = self.client.post('/mechanics/', json={
             "mechanic_name": "Alberto Millian",
@@ -112,6 +157,34 @@ class TestMechanics(unittest.TestCase):
         data = response.get_json()
         return data.get("id") if isinstance(data, dict) else None
 
+    def test_metrics_endpoint(self):
+        self.client.get('/mechanics/')
+        self.client.get('/mechanics/?limit=5')
+        self.client.get('/no-such-route')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertIn('http_requests_total{endpoint="mechanic_bp.get_mechanics",status="200"} 2', lines)
+        self.assertIn('http_requests_total{endpoint="unmatched",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{endpoint="mechanic_bp.get_mechanics"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="mechanic_bp.get_mechanics",le="+Inf"} 2', lines)
+        self.assertIn('db_statements_total{endpoint="mechanic_bp.get_mechanics"} 2', lines)
+        self.assertTrue(any(line.startswith('view_cache_requests_total{result="miss"}') for line in lines))
+        self.assertTrue(any(line.startswith("db_pool_checkouts_total ") for line in lines))
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics', environ_base={"REMOTE_ADDR": "203.0.113.7"}).status_code, 404)
+
+        with mock.patch.dict(os.environ, {"FLASK_METRICS_TOKEN": "s3cret"}):
+            client = self.create_app().test_client()
+        self.assertEqual(client.get('/metrics').status_code, 404)
+        self.assertEqual(client.get('/metrics', headers={"Authorization": "Bearer wrong"}).status_code, 404)
+        response = client.get('/metrics', headers={"Authorization": "Bearer s3cret"},
+                              environ_base={"REMOTE_ADDR": "203.0.113.7"})
+        self.assertEqual(response.status_code, 200)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,19 +1,18 @@
+import os
+import shutil
+import tempfile
 import unittest
-from app import create_app, db
-
-class TestServiceTickets(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app('testing')
-        self.client = self.app.test_client()
-        self.context = self.app.app_context()
-        self.context.push()
-        db.create_all()
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.context.pop()
+from flask import jsonify
+from sqlalchemy import event, select
+from app import db
+from tests.base import AppTestCase
+from app.models import ServiceTickets
+from app.utils.query_budget import query_budget, QueryBudgetExceeded
+from app.extensions import cache
+from app.utils.indexes import uppercase_vins
+from app.utils.seed import seed_database, vin_check_digit, vin_serial
 
+class TestServiceTickets(AppTestCase):
     def test_create_service_ticket(self):
         payload = {
             "service_description": "arreglo de motores",
@@ -79,5 +78,250 @@ class TestServiceTickets(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("Service ticket with ID", response.get_json()["message"])
 
+    def create_ticket_with_parts(self, part_ids, vin_number="1HGCM82633A654321"):
+        response = self.client.post('/service_tickets/', json={
+            "service_description": "arreglo de motores",
+            "cost": 1175,
+            "vin_number": vin_number,
+            "work_complete": False,
+            "car_submission_date": "2021-12-16",
+            "customer_id": 1,
+            "mechanic_id": 2})
+        ticket_id = response.get_json()["id"]
+        for part_id in part_ids:
+            self.client.post(f'/service_tickets/{ticket_id}/add_part', json={"part_id": part_id})
+        return ticket_id
+
+    def test_add_parts_decrements_stock(self):
+        brake_id = self.client.post('/inventory/', json={"name": "pastillas de freno", "price": 45.0, "quantity": 3}).get_json()["id"]
+        filter_id = self.client.post('/inventory/', json={"name": "filtro de aceite", "price": 11.39, "quantity": 1}).get_json()["id"]
+        ticket_id = self.create_ticket_with_parts([])
+
+        response = self.client.post(f'/service_tickets/{ticket_id}/add_part', json={"parts": [
+            {"part_id": brake_id, "quantity": 2},
+            {"part_id": filter_id}]})
+        self.assertEqual(response.status_code, 200)
+
+        # the second part is out of stock, so the whole request is rolled back
+        response = self.client.post(f'/service_tickets/{ticket_id}/add_part', json={"parts": [
+            {"part_id": brake_id},
+            {"part_id": filter_id}]})
+        self.assertEqual(response.status_code, 400)
+
+        stock = {item["id"]: item["quantity"] for item in self.client.get('/inventory/').get_json()}
+        self.assertEqual(stock, {brake_id: 1, filter_id: 0})
+
+        response = self.client.post(f'/service_tickets/{ticket_id}/add_part', json={"part_id": brake_id})
+        self.assertEqual(response.status_code, 200)
+        ticket = self.client.get('/service_tickets/').get_json()[0]
+        self.assertEqual(sorted(item["id"] for item in ticket["inventory_items"]), [brake_id, filter_id])
+        self.assertEqual(self.client.get('/inventory/').get_json()[0]["quantity"], 0)
+
+    def test_get_service_tickets_stream(self):
+        part_id = self.client.post('/inventory/', json={"name": "pastillas de freno", "price": 45.0, "quantity": 5}).get_json()["id"]
+        self.create_ticket_with_parts([part_id])
+        self.create_ticket_with_parts([])
+
+        response = self.client.get('/service_tickets/?stream=1')
+        self.assertEqual(response.status_code, 200)
+        tickets = response.get_json()
+        self.assertEqual(len(tickets), 2)
+        self.assertEqual(tickets[0]["inventory_items"][0]["name"], "pastillas de freno")
+        self.assertEqual(tickets[1]["inventory_items"], [])
+
+    def test_ticket_list_cache_follows_inventory_writes(self):
+        part_id = self.client.post('/inventory/', json={"name": "pastillas de freno", "price": 45.0, "quantity": 5}).get_json()["id"]
+        self.create_ticket_with_parts([part_id])
+        self.assertEqual(self.client.get('/service_tickets/').get_json()[0]["inventory_items"][0]["price"], 45.0)
+
+        self.client.put(f'/inventory/{part_id}', json={"name": "pastillas de freno", "price": 50.0, "quantity": 4})
+        self.assertEqual(self.client.get('/service_tickets/').get_json()[0]["inventory_items"][0]["price"], 50.0)
+
+    def test_add_part_negative(self):
+        ticket_id = self.create_ticket_with_parts([])
+        response = self.client.post(f'/service_tickets/{ticket_id}/add_part', json={"part_id": 9999})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/service_tickets/9999/add_part', json={"part_id": 1})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f'/service_tickets/{ticket_id}/add_part', json={"part_id": 1, "quantity": 0})
+        self.assertEqual(response.status_code, 400)
+
+    def count_statements(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_ticket_lists_do_not_lazy_load_parts(self):
+        part_ids = [self.client.post('/inventory/', json={
+            "name": f"pieza {n}",
+            "price": 10.0,
+            "quantity": 50}).get_json()["id"] for n in range(2)]
+
+        self.create_ticket_with_parts(part_ids)
+        few_tickets = self.count_statements('/service_tickets/')
+        few_search = self.count_statements('/service_tickets/search?vin_number=1HGCM')
+
+        for _ in range(5):
+            self.create_ticket_with_parts(part_ids)
+        many_tickets = self.count_statements('/service_tickets/')
+        many_search = self.count_statements('/service_tickets/search?vin_number=1HGCM')
+
+        self.assertEqual(few_tickets, many_tickets)
+        self.assertEqual(few_search, many_search)
+
+    def test_search_service_ticket_by_vin(self):
+        self.create_ticket_with_parts([], "1HGCM82633A654321")
+        self.create_ticket_with_parts([], "1hgcm82633a999999")
+        self.create_ticket_with_parts([], "WVWZZZ1JZXW000001")
+
+        def vins(url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return [ticket["vin_number"] for ticket in response.get_json()]
+
+        self.assertEqual(vins('/service_tickets/search?vin_number=1hgcm82633a654321'), ["1HGCM82633A654321"])
+        self.assertEqual(vins('/service_tickets/search?vin_number=1HGCM'), ["1HGCM82633A654321", "1HGCM82633A999999"])
+        self.assertEqual(vins('/service_tickets/search?vin_number=1HGCM&match=exact'), [])
+        self.assertEqual(vins('/service_tickets/search?vin_number=ZZZ'), [])
+        self.assertEqual(vins('/service_tickets/search?vin_number=ZZZ&match=contains'), ["WVWZZZ1JZXW000001"])
+        self.assertEqual(self.client.get('/service_tickets/search?vin_number=1&match=fuzzy').status_code, 400)
+
+    def test_lowercase_vins_are_upper_cased_once(self):
+        self.create_ticket_with_parts([])
+        db.session.execute(db.text("UPDATE service_tickets SET vin_number = lower(vin_number)"))
+        db.session.commit()
+        self.assertEqual(self.client.get('/service_tickets/search?vin_number=1HGCM').get_json(), [])
+
+        self.assertEqual(uppercase_vins(dry_run=True), 1)
+        self.assertEqual(uppercase_vins(), 1)
+        self.assertEqual(uppercase_vins(), 0)
+        data = self.client.get('/service_tickets/search?vin_number=1HGCM').get_json()
+        self.assertEqual([ticket["vin_number"] for ticket in data], ["1HGCM82633A654321"])
+
+    def test_vin_prefix_search_uses_index(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if "service_tickets.vin_number >=" in statement:
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            self.client.get('/service_tickets/search?vin_number=1HGCM')
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+        statement, parameters = statements[0]
+        plan = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        self.assertTrue(any("ix_service_tickets_vin_number" in row[-1] for row in plan))
+
+    def test_sql_json_aggregation_matches_projection(self):
+        part_ids = [self.client.post('/inventory/', json={
+            "name": f"pieza {n}",
+            "price": 10.5,
+            "quantity": 50}).get_json()["id"] for n in range(2)]
+        self.create_ticket_with_parts(list(reversed(part_ids)))
+        self.create_ticket_with_parts([], "WVWZZZ1JZXW000001")
+        urls = ['/service_tickets/', '/service_tickets/?limit=1', '/service_tickets/search?vin_number=1HGCM']
+
+        expected = [self.client.get(url).get_json() for url in urls]
+        cache.clear()
+        self.app.config["SQL_JSON_AGGREGATION"] = ["sqlite"]
+        actual = [self.client.get(url).get_json() for url in urls]
+
+        self.assertEqual(actual, expected)
+        self.assertIs(actual[0][0]["work_complete"], False)
+        self.assertEqual([item["id"] for item in actual[0][0]["inventory_items"]], part_ids)
+        self.assertEqual(actual[0][1]["inventory_items"], [])
+
+    def test_sparse_fieldsets(self):
+        part_id = self.client.post('/inventory/', json={"name": "pastillas de freno", "price": 45.0, "quantity": 5}).get_json()["id"]
+        self.create_ticket_with_parts([part_id])
+
+        response = self.client.get('/service_tickets/?fields=vin_number,work_complete')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{"id": 1, "vin_number": "1HGCM82633A654321", "work_complete": False}])
+        # without inventory_items there is no second SELECT for the parts
+        self.assertEqual(self.count_statements('/service_tickets/?fields=vin_number'), 1)
+        self.assertEqual(self.count_statements('/service_tickets/?fields=vin_number,inventory_items'), 2)
+
+        response = self.client.get('/service_tickets/search?vin_number=1HGCM&fields=inventory_items')
+        self.assertEqual(response.get_json()[0]["inventory_items"][0]["id"], part_id)
+        self.assertEqual(set(response.get_json()[0]), {"id", "inventory_items"})
+
+        response = self.client.get('/service_tickets/?fields=vin_number,customer_id')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("customer_id", response.get_json()["message"])
+
+    def test_query_budget_reports_n_plus_one(self):
+        @query_budget(2)
+        def lazy_ticket_parts():
+            tickets = db.session.execute(select(ServiceTickets)).scalars()
+            return jsonify([[item.name for item in ticket.inventory_items] for ticket in tickets])
+
+        # the shared app has served requests already, so the route goes on an app of its own
+        self.app = self.create_app()
+        self.client = self.app.test_client()
+        self.app.add_url_rule('/lazy-ticket-parts', 'lazy_ticket_parts', lazy_ticket_parts)
+        part_id = self.client.post('/inventory/', json={"name": "pastillas de freno", "price": 45.0, "quantity": 10}).get_json()["id"]
+        for _ in range(3):
+            self.create_ticket_with_parts([part_id])
+
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            self.client.get('/lazy-ticket-parts')
+        self.assertIn("ran 4 SQL statements, budget is 2", str(raised.exception))
+        self.assertIn("3x SELECT inventory.id", str(raised.exception))
+
+        # the real list stays inside its budget however many tickets there are
+        self.assertEqual(self.client.get('/service_tickets/?include_total=1').status_code, 200)
+
+    def test_seed_data_is_reproducible(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot = os.path.join(directory, 'seed.jsonl.gz')
+        counts = seed_database(200, seed=7, chunk_size=64, snapshot_path=snapshot)
+        self.assertEqual(counts['customers'], 200)
+        tickets = db.session.execute(select(ServiceTickets).order_by(ServiceTickets.id)).scalars().all()
+        self.assertEqual(len(tickets), counts['service_tickets'])
+        for ticket in tickets:
+            self.assertEqual(len(ticket.vin_number), 17)
+            self.assertEqual(ticket.vin_number[8], vin_check_digit(ticket.vin_number))
+            self.assertEqual(ticket.work_complete, ticket.work_finish_date is not None)
+        first = [(t.vin_number, t.cost, t.car_submission_date, t.mechanic_id) for t in tickets]
+
+        # the snapshot loads back to the same rows, and the CLI refuses to seed on top of existing data
+        runner = self.app.test_cli_runner()
+        self.assertNotEqual(runner.invoke(args=['seed-data', '--customers', '200']).exit_code, 0)
+        etag = self.client.get('/service_tickets/').headers["ETag"]
+        result = runner.invoke(args=['seed-data', '--reset', '--from-snapshot', snapshot])
+        self.assertEqual(result.exit_code, 0, result.output)
+        # the CLI bumps the table versions, so cached lists are rebuilt
+        self.assertEqual(self.client.get('/service_tickets/', headers={"If-None-Match": etag}).status_code, 200)
+        db.session.expire_all()
+        tickets = db.session.execute(select(ServiceTickets).order_by(ServiceTickets.id)).scalars().all()
+        self.assertEqual([(t.vin_number, t.cost, t.car_submission_date, t.mechanic_id) for t in tickets], first)
+
+        result = runner.invoke(args=['seed-data', '--reset', '--customers', '200', '--seed', '7'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        db.session.expire_all()
+        tickets = db.session.execute(select(ServiceTickets).order_by(ServiceTickets.id)).scalars().all()
+        self.assertEqual([(t.vin_number, t.cost, t.car_submission_date, t.mechanic_id) for t in tickets], first)
+
+        # past a million customers the serial doesn't repeat
+        self.assertEqual(vin_serial(7), "000007")
+        self.assertNotEqual(vin_serial(1000007), vin_serial(7))
+        self.assertEqual(vin_serial(33 ** 6 - 1), "ZZZZZZ")
+        self.assertRaises(ValueError, vin_serial, 33 ** 6)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()